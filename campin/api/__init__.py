@@ -1,6 +1,10 @@
 """
 Setup for Pyramid application.
 """
+import asyncio
+import json
+import logging
+
 import aiopyramid
 import asyncpg
 import googlemaps
@@ -9,7 +13,12 @@ from pyramid.events import NewRequest
 from pyramid.response import Response
 
 from campin.api import campsites
+from campin.api.availability import AvailabilityIndex
+from campin.api.cache import DataGeneration, ResponseCache
+from campin.api.drivetimes import DriveTimeWriter
+from campin.api.singleflight import SingleFlight
 
+log = logging.getLogger(__name__)
 
 def main(global_config, **app_settings):
     """Build Pyramid application."""
@@ -17,10 +26,30 @@ def main(global_config, **app_settings):
     settings.update(app_settings)
 
     config = Configurator(settings=settings)
+    config.registry.response_cache = ResponseCache(
+        int(settings.get('cache.max_size', 1024)),
+        int(settings.get('cache.ttl', 300))
+    )
+    config.registry.data_generation = DataGeneration(
+        int(settings.get('generation.check_interval', 5))
+    )
+    config.registry.single_flight = SingleFlight()
+
+    # The application is made before uWSGI forks its workers, so the pool,
+    # the availability index and the drive time writer are started by each
+    # worker on its own event loop when it is forked.
+    config.registry.pool = None
+    config.registry.availability = None
+    config.registry.drive_time_writer = None
+    config.registry.worker_startup = None
+    _start_on_fork(config.registry)
+
     # We're doing async!
     config.include(aiopyramid)
     config.add_request_method(_db_method, b'db')
     config.add_request_method(_gmaps_client, b'gmaps')
+    config.add_request_method(_availability_method, b'availability')
+    config.add_request_method(_data_generation_method, b'data_generation')
     config.add_subscriber(_add_cors_headers, NewRequest)
     config.include(campsites)
     config.add_notfound_view(_notfound)
@@ -32,40 +61,157 @@ def main(global_config, **app_settings):
 
 async def _db_method(request):
     """
-    Return database connection pool. 
+    Return database connection for the request from the application's pool. 
      
-    Pool will be created if it does not exist and persisted for the application
-    lifetime on the registry.
+    The same connection is returned for every call during a request.
     """
-    pool = request.registry.get('pool')
-    if not pool:
-        pool = request.registry.pool = await _setup_pool(request)
+    db = getattr(request, '_db_connection', None)
+    if db:
+        return db
 
-    db = await pool.acquire()
+    pool = await _worker_pool(request.registry)
+    db = request._db_connection = await pool.acquire()
 
-    async def release_db(_):
-        await pool.release(db)
+    def release_db(_):
+        # Finished callbacks are not awaited, so schedule the release.
+        asyncio.ensure_future(pool.release(db))
 
     # Put the connection back into the pool at the end of the request
     request.add_finished_callback(release_db)
     return db
 
 
-async def _setup_pool(request):
-    """Setup database pool based on application settings."""
-    settings = request.registry.settings
+async def _availability_method(request):
+    """
+    Return the availability index, refreshed with any reservations changed 
+    since the data generation last changed.
+    """
+    # The index is made when the worker starts, see _worker_pool
+    db = await request.db()
+    index = request.registry.availability
+    await index.refresh(db, await request.data_generation())
+    return index
+
+
+async def _data_generation_method(request):
+    """Return the data generation counter that responses are cached against."""
+    db = await request.db()
+    return await request.registry.data_generation.current(db)
+
+
+def _start_on_fork(registry):
+    """
+    Start each uWSGI worker as soon as it is forked, before its first request.
+
+    Outside of uWSGI the worker is started by its first request instead, see
+    _worker_pool.
+    """
+    try:
+        from uwsgidecorators import postfork
+    except ImportError:
+        log.info('Not running in uWSGI, the first request starts the worker.')
+        return
+
+    @postfork
+    def start_worker():
+        # Scheduled on the worker's event loop, which uWSGI runs next
+        _begin_startup(registry)
+
+
+def _begin_startup(registry):
+    """Schedule _start_worker and return its future."""
+    startup = registry.worker_startup = asyncio.ensure_future(
+        _start_worker(registry)
+    )
+
+    def started(future):
+        if future.cancelled() or future.exception() is None:
+            return
+        log.error('Could not start worker: {}'.format(future.exception()))
+        # Start again on the next request
+        if registry.worker_startup is future:
+            registry.worker_startup = None
+
+    startup.add_done_callback(started)
+    return startup
+
 
+async def _worker_pool(registry):
+    """
+    Return the database pool of this worker, waiting for the worker to start.
+
+    Workers are started when uWSGI forks them. If the worker wasn't started
+    that way, or starting it failed, the request starts it.
+    """
+    startup = registry.worker_startup
+    if startup is None:
+        startup = _begin_startup(registry)
+    return await startup
+
+
+async def _start_worker(registry):
+    """
+    Create the database pool, build the availability index and start saving
+    drive times.
+    """
+    pool = await _setup_pool(registry.settings)
+    registry.availability = AvailabilityIndex()
+    try:
+        await _warmup(registry, pool)
+    except Exception:
+        await pool.close()
+        raise
+    registry.drive_time_writer = DriveTimeWriter()
+    registry.drive_time_writer.start(pool)
+    registry.pool = pool
+    return pool
+
+
+async def _setup_pool(settings):
+    """Setup database pool based on application settings."""
     pool = await asyncpg.create_pool(
         database=settings['db.dbname'],
         user=settings['db.user'],
         password=settings['db.password'],
         host=settings['db.host'],
-        min_size=1
+        min_size=int(settings.get('db.pool_min_size', 1)),
+        max_size=int(settings.get('db.pool_max_size', 10)),
+        init=_init_connection
     )
 
     return pool
 
 
+async def _init_connection(db):
+    """
+    Register JSON codecs and prepare the search queries when a pooled 
+    connection is created.
+    
+    Prepared statements are kept in the connection's statement cache, so later
+    queries with the same text skip parsing and planning.
+    """
+    for typename in ('json', 'jsonb'):
+        await db.set_type_codec(
+            typename,
+            schema='pg_catalog',
+            encoder=json.dumps,
+            decoder=json.loads
+        )
+
+    for query in campsites.prepared_queries:
+        await db.prepare(query)
+
+
+async def _warmup(registry, pool):
+    """Build the availability index."""
+    db = await pool.acquire()
+    try:
+        generation = await registry.data_generation.current(db)
+        await registry.availability.build(db, generation)
+    finally:
+        await pool.release(db)
+
+
 def _notfound(exc, request):
     """
     Return the NotFound exception unless this is an OPTIONS request.
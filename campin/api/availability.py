@@ -0,0 +1,336 @@
+"""
+In-memory index of campsite availability.
+
+Every campsite is stored as a bitset (a plain python int) where bit ``n`` is
+set when the campsite is reserved on the ``n``th day after the index origin.
+Checking whether a campsite is free for a whole stay is then a single bitwise
+AND against a mask covering the dates of the stay.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+log = logging.getLogger(__name__)
+
+_campsites_query = """
+    SELECT
+      campsite_id,
+      park_id,
+      parent_park_name,
+      park_name
+    FROM campin.campsites
+    WHERE last_modified_date > coalesce($1::timestamptz, '-infinity')
+"""
+
+_reservations_query = """
+    SELECT
+      campsite_id,
+      array_agg(reserve_date) as reserve_dates
+    FROM campin.reservations
+    WHERE last_modified_date > coalesce($1::timestamptz, '-infinity')
+    GROUP BY campsite_id
+"""
+
+# Reservations that were removed since the last refresh. Rows are added by the
+# reservations_deleted trigger.
+_deletes_query = """
+    SELECT
+      campsite_id,
+      array_agg(reserve_date) as reserve_dates
+    FROM campin.reservation_deletes
+    WHERE deleted_date > $1
+    GROUP BY campsite_id
+"""
+
+# Campsites that were removed since the last refresh. Rows are added by the
+# campsites_deleted trigger.
+_campsite_deletes_query = """
+    SELECT DISTINCT campsite_id
+    FROM campin.campsite_deletes
+    WHERE deleted_date > $1
+"""
+
+# Every process using the index keeps its own watermark, so deletes are kept
+# for a while instead of being purged as soon as they are applied.
+_purge_deletes_query = """
+    DELETE FROM campin.reservation_deletes
+    WHERE deleted_date < current_timestamp - $1::interval
+"""
+
+_purge_campsite_deletes_query = """
+    DELETE FROM campin.campsite_deletes
+    WHERE deleted_date < current_timestamp - $1::interval
+"""
+
+
+class AvailabilityIndex(object):
+    """
+    Bitset per campsite of the dates it is reserved.
+
+    The index is built from ``campin.reservations`` by :meth:`build` and then
+    kept up to date by :meth:`refresh`, which only reads rows modified since
+    the previous refresh when the data generation changes.
+    """
+
+    # Rows committed by a transaction that started before the previous refresh
+    # can have an older last_modified_date, so re-read a window before the
+    # watermark. Applying a row twice is harmless.
+    refresh_overlap = timedelta(minutes=5)
+
+    # Deletes older than this are purged on refresh. An index that wasn't
+    # refreshed for this long is built again, since its deletes may be gone.
+    deletes_retention = timedelta(days=1)
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._origin = None
+        # campsite_id -> bitset of reserved days
+        self._reserved = {}
+        # campsite_id -> park_id
+        self._site_parks = {}
+        # park_name -> list of campsite_id
+        self._park_sites = {}
+        # park_id -> (parent_park_name, park_name)
+        self._parks = {}
+        self._watermark = None
+        self._generation = None
+
+    @property
+    def parks(self):
+        """Mapping of park id to a tuple of parent park name and park name."""
+        return self._parks
+
+    @property
+    def site_parks(self):
+        """Mapping of campsite id to park id."""
+        return self._site_parks
+
+    async def build(self, db, generation=None):
+        """Load every campsite and reservation into the index."""
+        async with self._lock:
+            self._reset()
+            await self._load(db, generation)
+        log.info('Built availability index for {} campsites.'.format(
+            len(self._site_parks)
+        ))
+
+    async def refresh(self, db, generation):
+        """
+        Apply reservations modified since the last refresh if the data
+        generation has changed.
+
+        :param db: Database connection.
+        :param generation: Current data generation.
+        """
+        if self._watermark is None:
+            await self.build(db, generation)
+            return
+
+        if generation == self._generation:
+            return
+
+        async with self._lock:
+            if generation != self._generation:
+                await self._load(db, generation)
+
+    def _reset(self):
+        self._origin = None
+        self._reserved = {}
+        self._site_parks = {}
+        self._park_sites = {}
+        self._parks = {}
+        self._watermark = None
+
+    async def _load(self, db, generation):
+        since = None
+        if self._watermark is not None:
+            since = self._watermark - self.refresh_overlap
+
+        now = await db.fetchval('SELECT current_timestamp')
+        if since is not None and now - since >= self.deletes_retention:
+            log.info('Availability index is stale, loading every campsite.')
+            self._reset()
+            since = None
+
+        for record in await db.fetch(_campsites_query, since):
+            self._add_campsite(
+                record['campsite_id'],
+                record['park_id'],
+                record['parent_park_name'],
+                record['park_name']
+            )
+
+        if since is not None:
+            for record in await db.fetch(_campsite_deletes_query, since):
+                self._remove_campsite(record['campsite_id'])
+
+            # Clear deleted reservations first, so a reservation that was
+            # deleted then inserted again is set by the query below.
+            for record in await db.fetch(_deletes_query, since):
+                self.clear(record['campsite_id'], record['reserve_dates'])
+
+        for record in await db.fetch(_reservations_query, since):
+            self.reserve(record['campsite_id'], record['reserve_dates'])
+
+        self._watermark = now
+        self._generation = generation
+        await db.execute(_purge_deletes_query, self.deletes_retention)
+        await db.execute(
+            _purge_campsite_deletes_query, self.deletes_retention
+        )
+
+    def _add_campsite(self, campsite_id, park_id, parent_park_name, park_name):
+        old_park_id = self._site_parks.get(campsite_id)
+        if old_park_id == park_id:
+            return
+        if old_park_id is not None:
+            # The campsite moved to another park
+            self._remove_from_park(campsite_id, old_park_id)
+        self._site_parks[campsite_id] = park_id
+        self._reserved.setdefault(campsite_id, 0)
+        self._park_sites.setdefault(park_name, []).append(campsite_id)
+        self._parks.setdefault(park_id, (parent_park_name, park_name))
+
+    def _remove_campsite(self, campsite_id):
+        park_id = self._site_parks.pop(campsite_id, None)
+        self._reserved.pop(campsite_id, None)
+        if park_id is not None:
+            self._remove_from_park(campsite_id, park_id)
+
+    def _remove_from_park(self, campsite_id, park_id):
+        _, park_name = self._parks[park_id]
+        site_ids = self._park_sites.get(park_name, [])
+        if campsite_id in site_ids:
+            site_ids.remove(campsite_id)
+
+    def reserve(self, campsite_id, reserve_dates):
+        """Mark the campsite as reserved on each of reserve_dates."""
+        if not reserve_dates:
+            return
+        # Moving the origin back shifts every bitset, so it is moved before
+        # the campsite's bitset is read.
+        self._offset(min(_as_date(d) for d in reserve_dates))
+        bits = self._reserved.get(campsite_id, 0)
+        for reserve_date in reserve_dates:
+            bits |= 1 << self._offset(reserve_date)
+        self._reserved[campsite_id] = bits
+
+    def clear(self, campsite_id, reserve_dates):
+        """Mark the campsite as free on each of reserve_dates."""
+        if self._origin is None:
+            return
+        bits = self._reserved.get(campsite_id, 0)
+        for reserve_date in reserve_dates:
+            offset = (_as_date(reserve_date) - self._origin).days
+            if offset >= 0:
+                bits &= ~(1 << offset)
+        self._reserved[campsite_id] = bits
+
+    def _offset(self, reserve_date):
+        """
+        Return the bit number for reserve_date, moving the origin back if
+        reserve_date is before it.
+        """
+        reserve_date = _as_date(reserve_date)
+        if self._origin is None:
+            self._origin = reserve_date
+
+        offset = (reserve_date - self._origin).days
+        if offset < 0:
+            self._reserved = {
+                campsite_id: bits << -offset
+                for campsite_id, bits in self._reserved.items()
+            }
+            self._origin = reserve_date
+            offset = 0
+        return offset
+
+    def _mask(self, start_date, end_date):
+        """Return a bitmask covering start_date to end_date inclusively."""
+        if self._origin is None:
+            return 0
+        start = (_as_date(start_date) - self._origin).days
+        end = (_as_date(end_date) - self._origin).days
+        if end < 0 or end < start:
+            return 0
+        start = max(start, 0)
+        return ((1 << (end - start + 1)) - 1) << start
+
+    def free_sites(self, start_date, end_date, park_name=None):
+        """
+        Return ids of campsites that are free on every date between
+        start_date and end_date inclusively.
+
+        :param park_name: Only return campsites in this park.
+        """
+        mask = self._mask(start_date, end_date)
+        if park_name is None:
+            site_ids = self._reserved.keys()
+        else:
+            site_ids = self._park_sites.get(park_name, [])
+
+        reserved = self._reserved
+        return [
+            campsite_id for campsite_id in site_ids
+            if not reserved.get(campsite_id, 0) & mask
+        ]
+
+    def free_counts(self, start_date, end_date):
+        """
+        Return a dictionary of park id to the number of campsites that are
+        free on every date between start_date and end_date inclusively.
+        """
+        counts = {}
+        site_parks = self._site_parks
+        for campsite_id in self.free_sites(start_date, end_date):
+            park_id = site_parks.get(campsite_id)
+            if park_id is not None:
+                counts[park_id] = counts.get(park_id, 0) + 1
+        return counts
+
+    def free_stays(self, start_date, end_date, nights):
+        """
+        Return the dates each campsite is free for a stay of consecutive 
+        nights between start_date and end_date.
+
+        :param start_date: First night that can be stayed.
+        :param end_date: Last night that can be stayed.
+        :param nights: Number of consecutive nights.
+        :return: Dictionary of campsite id to a bitset of the start dates of
+            free stays, where bit ``n`` is ``n`` days after start_date. 
+            Campsites without any free stays are not included.
+        """
+        days = (_as_date(end_date) - _as_date(start_date)).days + 1
+        if nights < 1 or days < nights:
+            return {}
+
+        window = (1 << days) - 1
+        offset = 0
+        if self._origin is not None:
+            offset = (_as_date(start_date) - self._origin).days
+
+        stays = {}
+        for campsite_id, reserved in self._reserved.items():
+            if offset >= 0:
+                reserved >>= offset
+            else:
+                reserved <<= -offset
+            free = ~reserved & window
+
+            # A stay can start on a day if that day and each of the following
+            # nights - 1 days are free.
+            starts = free
+            for night in range(1, nights):
+                starts &= free >> night
+                if not starts:
+                    break
+
+            if starts:
+                stays[campsite_id] = starts
+        return stays
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    return value
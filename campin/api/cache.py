@@ -0,0 +1,74 @@
+"""
+Caching of search responses.
+
+Reservations only change when the reservation scraper runs, so responses are
+cached against the data generation, a counter in ``campin.data_generation``
+that the reservation pipeline increments after saving reservations.
+"""
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+log = logging.getLogger(__name__)
+
+
+class ResponseCache(object):
+    """Least recently used cache where entries expire after a time to live."""
+
+    def __init__(self, max_size=1024, ttl=300):
+        """
+        :param max_size: Maximum number of cached responses.
+        :param ttl: Seconds before a cached response expires.
+        """
+        self._max_size = max_size
+        self._ttl = timedelta(seconds=ttl)
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Return the cached value for key or None if missing or expired."""
+        try:
+            expires, value = self._entries[key]
+        except KeyError:
+            return None
+
+        if expires < datetime.now():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        """Cache value for key, evicting the least recently used entry if full."""
+        self._entries[key] = (datetime.now() + self._ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+
+class DataGeneration(object):
+    """
+    Current value of the data generation counter.
+
+    The counter is read from the database at most once every check interval.
+    """
+
+    def __init__(self, check_interval=5):
+        """
+        :param check_interval: Seconds between reading the counter.
+        """
+        self._check_interval = timedelta(seconds=check_interval)
+        self._generation = None
+        self._checked_at = None
+
+    async def current(self, db):
+        """Return the data generation."""
+        now = datetime.now()
+        if self._checked_at is None or (
+            now - self._checked_at >= self._check_interval
+        ):
+            self._generation = await db.fetchval(
+                'SELECT generation FROM campin.data_generation'
+            )
+            self._checked_at = now
+        return self._generation
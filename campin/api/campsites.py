@@ -1,23 +1,32 @@
 import asyncio
-import json
 import logging
 import re
 from datetime import timedelta
 
 from aiopyramid.helpers import use_executor
+from pyramid.httpexceptions import HTTPNotFound
 from pyramid.view import view_config
 
-from campin.api.forms import SearchSchema
+from campin.api.forms import (
+    BatchSearchSchema,
+    CalendarSchema,
+    FlexibleSearchSchema,
+    SearchSchema
+)
 
 log = logging.getLogger(__name__)
 
 
 def includeme(config):
     config.add_route('campsites free', '/parks/{park_name}/campsites/free')
+    config.add_route('campsites free batch', '/parks/campsites/free')
     config.add_route('parks free', '/parks/free')
+    config.add_route('parks free flexible', '/parks/free/flexible')
+    config.add_route('park calendar', '/parks/{park_name}/calendar')
 
 
-# Query for finding campsites that are free.
+# Query for campsite details of the campsites found to be free in the
+# availability index.
 # Note that asyncpg requires the $1 syntax for parameters.
 _search_query = """
     SELECT
@@ -29,59 +38,131 @@ _search_query = """
       ci.images
     FROM campin.campsites c
     LEFT OUTER JOIN (
-      SELECT campsite_id, array_agg($4 || image_name) as images
+      SELECT campsite_id, array_agg($2 || image_name) as images
       FROM campin.campsite_images
       GROUP BY 1
     ) as ci USING (campsite_id)
-    WHERE
-      c.campsite_id not in (
-        SELECT campsite_id
-        FROM campin.reservations r 
-        WHERE r.reserve_date BETWEEN $1 and $2
-      )
-    AND park_name = $3 
+    WHERE c.campsite_id = any($1::integer[])
     ORDER BY 
       park_name, 
       LPAD(site_number, 3, '0')
 """
 
-# Query for finding parks that have campsites that are free.
-_park_search_query = """
-  SELECT DISTINCT
-      c.park_id as "parkId",
-      c.parent_park_name as "parentParkName",
-      c.park_name as "parkName",
+# Query for drive times to the parks found to have free campsites in the
+# availability index.
+_drive_hours_query = """
+    SELECT
+      park_id as "parkId",
       round(
-        cast(extract(epoch from dh.drive_hours) / 3600 as numeric),
+        cast(extract(epoch from drive_hours) / 3600 as numeric),
         1
       ) as "driveHours",
-      count(c.campsite_id) as "freeSites"
-    FROM campin.campsites c
-      INNER JOIN campin.parks p USING(park_id)
-      LEFT OUTER JOIN (
-        SELECT 
-          park_id,
-          origin,
-          drive_hours
-        FROM campin.park_drive_hours
-        WHERE origin = $3
-      ) as dh
-      ON p.park_id = dh.park_id
-    WHERE
-      c.campsite_id not in (
-        SELECT campsite_id
-        FROM campin.reservations r 
-        WHERE r.reserve_date BETWEEN $1 and $2
-      )
-    AND (
-      dh.drive_hours <= coalesce($4, dh.drive_hours)
-      OR dh.drive_hours is NULL
-    )     
-    GROUP BY 1, 2, 3, 4
+      drive_hours <= coalesce($3, drive_hours) as "withinDriveHours"
+    FROM campin.park_drive_hours
+    WHERE park_id = any($1::integer[])
+    AND origin = $2
+"""
+
+# Query for site numbers of campsites found to be free in the availability
+# index.
+_site_numbers_query = """
+    SELECT
+      campsite_id as "campsiteId",
+      campground_name as "campgroundName",
+      site_number as "siteNumber"
+    FROM campin.campsites
+    WHERE campsite_id = any($1::integer[])
     ORDER BY 
-      c.park_name
+      LPAD(site_number, 3, '0')
+"""
+
+# Query for park details.
+_park_query = """
+    SELECT 
+        p.park_name as "parkName",
+        p.url as "parkUrl",
+        parent.park_name as "parentParkName"
+    FROM parks p
+    LEFT OUTER JOIN parks parent 
+      ON p.parent_park_id = parent.park_id
+    WHERE p.park_name = $1
+"""
+
+# Query for the free campsite counts of each campground in a park. Dates
+# without a count have no reservations.
+_calendar_query = """
+    SELECT
+      totals.campground_name as "campgroundName",
+      totals.total_count as "totalCount",
+      array_agg(a.reserve_date) as reserve_dates,
+      array_agg(a.free_count) as free_counts
+    FROM (
+      SELECT
+        park_id,
+        coalesce(campground_name, '') as campground_name,
+        count(campsite_id) as total_count
+      FROM campin.campsites
+      WHERE park_name = $1
+      GROUP BY 1, 2
+    ) as totals
+    LEFT OUTER JOIN campin.park_date_availability a
+      ON a.park_id = totals.park_id
+      AND a.campground_name = totals.campground_name
+      AND a.reserve_date BETWEEN $2 AND $3
+    GROUP BY 1, 2
+    ORDER BY 1
 """
 
+# Query for several parks and the details of their campsites that were found
+# to be free in the availability index.
+_batch_search_query = """
+    SELECT
+      p.park_name as "parkName",
+      p.url as "parkUrl",
+      parent.park_name as "parentParkName",
+      coalesce(s.sites, '[]') as sites
+    FROM parks p
+    LEFT OUTER JOIN parks parent
+      ON p.parent_park_id = parent.park_id
+    LEFT OUTER JOIN (
+      SELECT
+        c.park_name,
+        json_agg(
+          json_build_object(
+            'parentParkName', c.parent_park_name,
+            'parkName', c.park_name,
+            'campgroundName', c.campground_name,
+            'siteNumber', c.site_number,
+            'details', c.details,
+            'images', ci.images
+          )
+          ORDER BY LPAD(c.site_number, 3, '0')
+        ) as sites
+      FROM campin.campsites c
+      LEFT OUTER JOIN (
+        SELECT campsite_id, array_agg($3 || image_name) as images
+        FROM campin.campsite_images
+        WHERE campsite_id = any($2::integer[])
+        GROUP BY 1
+      ) as ci USING (campsite_id)
+      WHERE c.campsite_id = any($2::integer[])
+      GROUP BY c.park_name
+    ) as s
+      ON s.park_name = p.park_name
+    WHERE p.park_name = any($1::varchar[])
+    ORDER BY p.park_name
+"""
+
+# Queries prepared on each pooled connection when it is created.
+prepared_queries = (
+    _search_query,
+    _drive_hours_query,
+    _site_numbers_query,
+    _park_query,
+    _calendar_query,
+    _batch_search_query
+)
+
 
 @view_config(route_name='campsites free', request_method='GET', renderer='json')
 async def free_campsites(request):
@@ -96,43 +177,34 @@ async def free_campsites(request):
     """
     # TODO: convert Invalid exception to a standard error JSON return value
     results = SearchSchema().to_python(request.params)
-
     park_name = request.matchdict['park_name']
+
+    return await _cached_response(
+        request,
+        ('campsites free', park_name, _normalize(results)),
+        lambda: _free_campsites(request, park_name, results)
+    )
+
+
+async def _free_campsites(request, park_name, results):
+    """Build the response for :func:`free_campsites`."""
     start_date = results['start_date']
     end_date = results['end_date'] - timedelta(days=1)
 
+    availability = await request.availability()
+    site_ids = availability.free_sites(start_date, end_date, park_name)
+
     db = await request.db()
     results = await db.fetch(
         _search_query,
-        start_date,
-        end_date,
-        park_name,
+        site_ids,
         request.registry.settings['image_base_url']
     )
 
-    sites = []
-    for record in results:
-        record = dict(record.items())
-        # If psycopg (or aiopg) is used it should handle the JSONB columns without
-        # needing this manual cast.
-        # Asyncpg isn't so helpful.
-        if record['details']:
-            record['details'] = json.loads(record['details'])
-        sites.append(record)
-
-    park_result = await db.fetch(
-        """
-            SELECT 
-                p.park_name as "parkName",
-                p.url as "parkUrl",
-                parent.park_name as "parentParkName"
-            FROM parks p
-            LEFT OUTER JOIN parks parent 
-              ON p.parent_park_id = parent.park_id
-            WHERE p.park_name = $1
-        """,
-        park_name
-    )
+    # JSONB details are decoded by the codec registered on the connection.
+    sites = [dict(record.items()) for record in results]
+
+    park_result = await db.fetch(_park_query, park_name)
     park = dict(park_result[0])
 
     return {
@@ -143,6 +215,66 @@ async def free_campsites(request):
     }
 
 
+@view_config(
+    route_name='campsites free batch', request_method='GET', renderer='json'
+)
+async def free_campsites_batch(request):
+    """
+    Return campsites in each of several parks that have reservations 
+    available for the entire duration between start_date and end_date 
+    parameters.
+    
+    Required parameters:
+    
+    * park_name --- Name of a park. Repeat for each park.
+    * start_date --- Date arriving at campground. In format YYYY-MM-DD.
+    * end_date --- Date leaving campground. In format YYYY-MM-DD.
+    """
+    results = BatchSearchSchema().to_python(request.params.mixed())
+    results['park_name'] = tuple(sorted(set(results['park_name'])))
+
+    return await _cached_response(
+        request,
+        ('campsites free batch', _normalize(results)),
+        lambda: _free_campsites_batch(request, results)
+    )
+
+
+async def _free_campsites_batch(request, results):
+    """Build the response for :func:`free_campsites_batch`."""
+    park_names = list(results['park_name'])
+    start_date = results['start_date']
+    end_date = results['end_date'] - timedelta(days=1)
+
+    availability = await request.availability()
+    site_ids = []
+    for park_name in park_names:
+        site_ids.extend(
+            availability.free_sites(start_date, end_date, park_name)
+        )
+
+    db = await request.db()
+    records = await db.fetch(
+        _batch_search_query,
+        park_names,
+        site_ids,
+        request.registry.settings['image_base_url']
+    )
+
+    parks = []
+    for record in records:
+        park = dict(record.items())
+        sites = park.pop('sites')
+        parks.append({
+            'park': park,
+            'sites': sites
+        })
+
+    return {
+        'data': parks
+    }
+
+
 @view_config(route_name='parks free', request_method='GET', renderer='json')
 async def free_parks(request):
     """
@@ -156,45 +288,197 @@ async def free_parks(request):
     """
     results = SearchSchema().to_python(request.params)
 
+    return await _cached_response(
+        request,
+        ('parks free', _normalize(results)),
+        lambda: _free_parks(request, results)
+    )
+
+
+async def _free_parks(request, results):
+    """Build the response for :func:`free_parks`."""
     start_date = results['start_date']
     end_date = results['end_date'] - timedelta(days=1)
+
+    availability = await request.availability()
+    free_counts = availability.free_counts(start_date, end_date)
+
+    parks = await _parks_within_drive(
+        request,
+        availability,
+        free_counts,
+        results['from_place'],
+        results['drive_hours']
+    )
+    for park in parks:
+        park['freeSites'] = free_counts[park['parkId']]
+
+    return {
+        'data': parks
+    }
+
+
+@view_config(route_name='parks free flexible', request_method='GET', renderer='json')
+async def free_parks_flexible(request):
+    """
+    Return parks that have reservations available for a number of 
+    consecutive nights anywhere between window_start and window_end, with the
+    dates a stay could start on.
+    
+    Required parameters:
+    
+    * window_start --- Earliest date arriving at campground. In format YYYY-MM-DD.
+    * window_end --- Latest date leaving campground. In format YYYY-MM-DD.
+    * nights --- Number of nights to stay.
+    
+    Optional parameters:
+    
+    * include_sites --- Also return the start dates for each campsite.
+    """
+    results = FlexibleSearchSchema().to_python(request.params)
+
+    return await _cached_response(
+        request,
+        ('parks free flexible', _normalize(results)),
+        lambda: _free_parks_flexible(request, results)
+    )
+
+
+async def _free_parks_flexible(request, results):
+    """Build the response for :func:`free_parks_flexible`."""
+    window_start = results['window_start']
+    # Last night that can be stayed.
+    window_end = results['window_end'] - timedelta(days=1)
+
+    availability = await request.availability()
+    site_starts = availability.free_stays(
+        window_start,
+        window_end,
+        results['nights']
+    )
+
+    # Start dates of a park are the start dates of any of its campsites.
+    # Reservations can be loaded before their campsite, which is skipped.
+    park_starts = {}
+    for campsite_id, starts in site_starts.items():
+        park_id = availability.site_parks.get(campsite_id)
+        if park_id is not None:
+            park_starts[park_id] = park_starts.get(park_id, 0) | starts
+
+    parks = await _parks_within_drive(
+        request,
+        availability,
+        park_starts,
+        results['from_place'],
+        results['drive_hours']
+    )
+
+    sites = {}
+    if results['include_sites'] and parks:
+        park_ids = {park['parkId'] for park in parks}
+        site_ids = [
+            campsite_id for campsite_id in site_starts
+            if availability.site_parks.get(campsite_id) in park_ids
+        ]
+        db = await request.db()
+        for record in await db.fetch(_site_numbers_query, site_ids):
+            record = dict(record.items())
+            campsite_id = record.pop('campsiteId')
+            record['startDates'] = _start_dates(
+                window_start,
+                site_starts[campsite_id]
+            )
+            sites.setdefault(
+                availability.site_parks[campsite_id], []
+            ).append(record)
+
+    for park in parks:
+        park['startDates'] = _start_dates(
+            window_start,
+            park_starts[park['parkId']]
+        )
+        if results['include_sites']:
+            park['sites'] = sites.get(park['parkId'], [])
+
+    return {
+        'data': parks
+    }
+
+
+def _start_dates(window_start, starts):
+    """
+    Return a list of dates in format YYYY-MM-DD for each bit set in starts, 
+    where bit ``n`` is ``n`` days after window_start.
+    """
+    dates = []
+    day = 0
+    while starts:
+        if starts & 1:
+            dates.append((window_start + timedelta(days=day)).strftime('%Y-%m-%d'))
+        starts >>= 1
+        day += 1
+    return dates
+
+
+async def _parks_within_drive(request, availability, park_ids, from_place,
+                              drive_hours):
+    """
+    Return park records for park_ids that are within drive_hours of 
+    from_place, sorted by park name.
+    
+    Drive times that are not in the database are found with the Google Maps
+    API and saved in the background.
+    
+    :param request: Pyramid request.
+    :param availability: Availability index, used for park names.
+    :param park_ids: Iterable of park ids.
+    :param from_place: Origin city to calculate drive time from. May be None.
+    :param drive_hours: Maximum drive time in hours. 0 or None for no maximum.
+    """
     # Convert "0" drive hours to None for db query
-    drive_hours = results['drive_hours'] or None
+    drive_hours = drive_hours or None
     if drive_hours:
         log.debug('Max drive time: {} hours'.format(drive_hours))
         drive_hours = timedelta(hours=drive_hours)
-    from_place = results['from_place']
 
     db = await request.db()
-    results = await db.fetch(
-        _park_search_query,
-        start_date,
-        end_date,
-        from_place,
-        drive_hours
-    )
+    drive_times = {
+        record['parkId']: record
+        for record in await db.fetch(
+            _drive_hours_query,
+            list(park_ids),
+            from_place,
+            drive_hours
+        )
+    }
 
     parks = []
     find_times = []
-    for record in results:
-        record = dict(record.items())
+    for park_id in park_ids:
+        parent_park_name, park_name = availability.parks[park_id]
+        drive_time = drive_times.get(park_id)
+        if drive_time and not drive_time['withinDriveHours']:
+            continue
+
+        record = {
+            'parkId': park_id,
+            'parentParkName': parent_park_name,
+            'parkName': park_name,
+            'driveHours': drive_time['driveHours'] if drive_time else None,
+        }
         if record['driveHours']:
             # Convert decimal type to float for serialization
             record['driveHours'] = float(record['driveHours'])
         else:
             if from_place:
-                find_times.append(find_and_save(
-                    request,
-                    from_place,
-                    record,
-                ))
+                find_times.append(record)
                 # Will be appended to parks when processing results
                 # of find_times.
                 continue
 
         parks.append(record)
 
-    add_parks = await asyncio.gather(*find_times)
+    add_parks = await find_and_save(request, from_place, find_times)
     parks.extend(
         filter(
             lambda el: el is not None and
@@ -206,98 +490,233 @@ async def free_parks(request):
     )
     parks.sort(key=lambda el: el['parkName'])
 
-    # Cannot be gathered because they run on a single db connection.
-    for add_park in add_parks:
-        if add_park['driveHours']:
-            await save_drive_time(
-                db,
-                from_place,
-                add_park['parkId'],
-                timedelta(hours=add_park['driveHours'])
-            )
+    # Saved in the background so the response doesn't wait on the inserts.
+    request.registry.drive_time_writer.put(
+        from_place,
+        [
+            (add_park['parkId'], timedelta(hours=add_park['driveHours']))
+            for add_park in add_parks
+            if add_park['driveHours']
+        ]
+    )
+
+    return parks
+
+
+@view_config(route_name='park calendar', request_method='GET', renderer='json')
+async def park_calendar(request):
+    """
+    Return the number of free campsites in the park on each date between 
+    start_date and end_date, in total and for each campground.
+    
+    Counts are lists with one element per date starting at start_date.
+    
+    Required parameters:
+    
+    * start_date --- First date of the calendar. In format YYYY-MM-DD.
+    * end_date --- Last date of the calendar. In format YYYY-MM-DD.
+
+    Responds with 404 Not Found when there is no park named park_name.
+    """
+    results = CalendarSchema().to_python(request.params)
+    park_name = request.matchdict['park_name']
+
+    return await _cached_response(
+        request,
+        ('park calendar', park_name, _normalize(results)),
+        lambda: _park_calendar(request, park_name, results)
+    )
+
+
+async def _park_calendar(request, park_name, results):
+    """Build the response for :func:`park_calendar`."""
+    start_date = results['start_date'].date()
+    end_date = results['end_date'].date()
+    days = (end_date - start_date).days + 1
+
+    db = await request.db()
+    records = await db.fetch(_calendar_query, park_name, start_date, end_date)
+    if not records and not await db.fetch(_park_query, park_name):
+        raise HTTPNotFound('Park not found: {}'.format(park_name))
+
+    campgrounds = []
+    free_counts = [0] * days
+    total_count = 0
+    for record in records:
+        # Dates without a row have every campsite free.
+        counts = [record['totalCount']] * days
+        for reserve_date, free_count in zip(
+                record['reserve_dates'], record['free_counts']
+        ):
+            if reserve_date is not None:
+                counts[(reserve_date - start_date).days] = free_count
+
+        campgrounds.append({
+            'campgroundName': record['campgroundName'] or None,
+            'totalCount': record['totalCount'],
+            'freeCounts': counts,
+        })
+        total_count += record['totalCount']
+        free_counts = [a + b for a, b in zip(free_counts, counts)]
 
     return {
-        'data': parks
+        'data': {
+            'parkName': park_name,
+            'startDate': start_date.strftime('%Y-%m-%d'),
+            'endDate': end_date.strftime('%Y-%m-%d'),
+            'totalCount': total_count,
+            'freeCounts': free_counts,
+            'campgrounds': campgrounds,
+        }
     }
 
 
-async def find_and_save(request, origin, record):
+async def _cached_response(request, key, build_response):
     """
-    Set the drive time on the park record.
+    Return the cached response for key, calling build_response to create it 
+    if it is not cached for the current data generation.
+    
+    Concurrent requests for a response that is not cached share one call of
+    build_response.
+    
+    :param request: Pyramid request.
+    :param key: Hashable key identifying the response.
+    :param build_response: Coroutine function returning the response.
+    """
+    cache = request.registry.response_cache
+    key = (key, await request.data_generation())
+
+    response = cache.get(key)
+    if response is None:
+        response = await request.registry.single_flight.do(key, build_response)
+        cache.set(key, response)
+    return response
+
+
+def _normalize(results):
+    """Return validated search parameters as a hashable cache key."""
+    return tuple(sorted(results.items()))
+
+
+async def find_and_save(request, origin, records):
+    """
+    Set the drive time on the park records.
+    
+    Parks are looked up in batches of destinations, with the batches running 
+    concurrently on the executor. Parks already being looked up for origin by
+    another request share that request's lookup.
     
     :param request: Pyramid request.
     :param origin: Origin city to calculate drive time from.
-    :param record: Database record with parkName key set. This is the destination 
-        that will be used when calculating drive time.
-    :return: record with driveHours key set to the number of hours to drive from
+    :param records: Database records with parkName key set. These are the 
+        destinations that will be used when calculating drive time.
+    :return: records with driveHours key set to the number of hours to drive from
         origin to record['parkName']. If the drive time cannot be determined it will
         be set to None.
     """
-    park_name = record['parkName']
+    async def find_batches(keys):
+        park_names = [park_name for _, _, park_name in keys]
+        batches = await asyncio.gather(*[
+            find_drive_times(
+                request,
+                origin,
+                park_names[i:i + _max_destinations]
+            )
+            for i in range(0, len(park_names), _max_destinations)
+        ])
+
+        drive_times = {}
+        for batch in batches:
+            drive_times.update(
+                (('drive time', origin, park_name), drive_time)
+                for park_name, drive_time in batch.items()
+            )
+        return drive_times
 
-    park_drive_hours = await find_drive_time(
-        request,
-        origin,
-        park_name
+    drive_times = await request.registry.single_flight.do_many(
+        [('drive time', origin, record['parkName']) for record in records],
+        find_batches
     )
-    if park_drive_hours:
-        record['driveHours'] = round(park_drive_hours.total_seconds() / 3600.0, 1)
-    else:
-        record['driveHours'] = None
-    return record
+
+    for record in records:
+        park_drive_hours = drive_times[('drive time', origin, record['parkName'])]
+        if park_drive_hours:
+            record['driveHours'] = round(
+                park_drive_hours.total_seconds() / 3600.0, 1
+            )
+        else:
+            record['driveHours'] = None
+    return records
+
+
+# Maximum number of destinations in one Distance Matrix API request.
+_max_destinations = 25
 
 
 @use_executor
-def find_drive_time(request, origin, park_name):
+def find_drive_times(request, origin, park_names):
     """
-    Return the drive time in hours from origin to the provincial park. 
+    Return the drive times from origin to each of the provincial parks using
+    a single Distance Matrix API request.
     
     :param request: Pyramid request.
     :param origin: Origin city to calculate drive time from.
-    :param park_name: This is the destination that will be used when calculating drive 
-        time.
-    :return: Drive time in hours. Returns None if drive time could not be determined.
+    :param park_names: These are the destinations that will be used when 
+        calculating drive time. At most ``_max_destinations`` parks.
+    :return: Dictionary of park name to drive time. Drive time is None if it 
+        could not be determined.
     """
     gmaps = request.gmaps()
     distance = gmaps.distance_matrix(
         units='metric',
         origins=origin,
-        destinations='{} Provincial Park, Ontario, Canada'.format(park_name)
+        destinations=[
+            '{} Provincial Park, Ontario, Canada'.format(park_name)
+            for park_name in park_names
+        ]
     )
 
     try:
-        distance = (distance['rows'][0]['elements'][0]['duration']['text'])
+        elements = distance['rows'][0]['elements']
     except (IndexError, KeyError):
-        log.info(
-            'Could not find distance from {}. Park: {}'.format(
-                origin, park_name
+        elements = []
+
+    drive_times = {}
+    for i, park_name in enumerate(park_names):
+        try:
+            duration = elements[i]['duration']['text']
+        except (IndexError, KeyError):
+            log.info(
+                'Could not find distance from {}. Park: {}'.format(
+                    origin, park_name
+                )
             )
+            drive_times[park_name] = None
+        else:
+            drive_times[park_name] = _parse_duration(duration)
+    return drive_times
+
+
+def _parse_duration(distance):
+    """
+    Return a timedelta from a Distance Matrix duration such as "2 hours 5 mins".
+    Returns None if the duration could not be parsed.
+    """
+    match = re.match(
+        r'(?:(?P<hours>\d+) hours? )?(?:(?P<minutes>\d+) mins?)?',
+        distance
+    )
+    if match:
+        distance = timedelta(
+            hours=int(match.group('hours')) if match.group('hours') else 0,
+            minutes=int(match.group('minutes') if match.group('minutes') else 0)
         )
-        distance = None
     else:
-        match = re.match(
-            r'(?:(?P<hours>\d+) hours? )?(?:(?P<minutes>\d+) mins?)?',
-            distance
-        )
-        if match:
-            distance = timedelta(
-                hours=int(match.group('hours')) if match.group('hours') else 0,
-                minutes=int(match.group('minutes') if match.group('minutes') else 0)
-            )
-        else:
-            log.debug(
-                'Could not match regex for interval. Distance string: "{}"'.format(
-                    distance
-                )
+        log.debug(
+            'Could not match regex for interval. Distance string: "{}"'.format(
+                distance
             )
-            distance = None
+        )
+        distance = None
     return distance
 
-
-async def save_drive_time(db, origin, park_id, drive_hours):
-    """Save the drive time from origin to the provincial park in the database."""
-    await db.execute("""
-        INSERT INTO campin.park_drive_hours(park_id, origin, drive_hours)
-        VALUES($1, $2, $3)
-    """, park_id, origin, drive_hours)
-
@@ -0,0 +1,77 @@
+"""
+Write-behind saving of drive times found while searching.
+
+Drive times are queued by the request and saved in bulk by a background task,
+so responses don't wait on the inserts.
+"""
+import asyncio
+import logging
+
+log = logging.getLogger(__name__)
+
+# Concurrent requests for the same origin may find the same drive times, so
+# rows that already exist are skipped.
+_upsert_query = """
+    INSERT INTO campin.park_drive_hours(park_id, origin, drive_hours)
+    SELECT park_id, origin, drive_hours
+    FROM unnest($1::integer[], $2::varchar[], $3::interval[])
+      as t(park_id, origin, drive_hours)
+    ON CONFLICT (park_id, origin) DO NOTHING
+"""
+
+
+class DriveTimeWriter(object):
+    """Queue of drive times saved in batches on a pooled connection."""
+
+    def __init__(self, max_batch_size=500):
+        """
+        :param max_batch_size: Maximum rows saved by one statement.
+        """
+        self._max_batch_size = max_batch_size
+        # Made by start, on the event loop that saves the drive times
+        self._queue = None
+        self._pool = None
+        self._task = None
+
+    def start(self, pool):
+        """Start saving queued drive times using connections from pool."""
+        if self._task:
+            return
+        self._pool = pool
+        self._queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._run())
+
+    def put(self, origin, drive_times):
+        """
+        Queue drive times to be saved.
+
+        :param origin: Origin city the drive times were calculated from.
+        :param drive_times: Iterable of park id and drive time timedelta.
+        """
+        for park_id, drive_hours in drive_times:
+            self._queue.put_nowait((park_id, origin, drive_hours))
+
+    async def _run(self):
+        while True:
+            rows = [await self._queue.get()]
+            while not self._queue.empty() and len(rows) < self._max_batch_size:
+                rows.append(self._queue.get_nowait())
+
+            try:
+                await self._save(rows)
+            except Exception:
+                log.exception('Could not save {} drive times.'.format(len(rows)))
+
+    async def _save(self, rows):
+        park_ids, origins, drive_hours = zip(*rows)
+        db = await self._pool.acquire()
+        try:
+            await db.execute(
+                _upsert_query,
+                list(park_ids),
+                list(origins),
+                list(drive_hours)
+            )
+        finally:
+            await self._pool.release(db)
+        log.debug('Saved {} drive times.'.format(len(rows)))
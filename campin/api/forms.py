@@ -1,7 +1,7 @@
 from datetime import datetime
 
-from formencode import Schema, FancyValidator, Invalid
-from formencode.validators import Int, UnicodeString
+from formencode import Schema, FancyValidator, ForEach, Invalid
+from formencode.validators import Int, StringBool, UnicodeString
 
 
 class DateValidator(FancyValidator):
@@ -44,6 +44,37 @@ class DateAfterDateValidator(FancyValidator):
             )
 
 
+class MaxDaysValidator(FancyValidator):
+    """Ensure that there are no more than a number of days between two dates."""
+
+    def __init__(self, start_date_field, end_date_field, max_days, *args,
+                 **kwargs):
+        """
+        :param start_date_field: Name of earlier date field. 
+        :param end_date_field: Name of later date field.
+        :param max_days: Maximum number of days between the dates.
+        """
+        super().__init__(*args, **kwargs)
+        self._start_date_field = start_date_field
+        self._end_date_field = end_date_field
+        self._max_days = max_days
+
+    def validate_python(self, value_dict, state):
+        start_date = value_dict[self._start_date_field]
+        end_date = value_dict[self._end_date_field]
+
+        if (end_date - start_date).days > self._max_days:
+            raise Invalid(
+                '{} must be at most {} days after {}.'.format(
+                    self._end_date_field,
+                    self._max_days,
+                    self._start_date_field
+                ),
+                value_dict,
+                state,
+            )
+
+
 class SearchSchema(Schema):
     """Search schema for searching campsites and parks."""
     start_date = DateValidator(not_empty=True)
@@ -52,3 +83,37 @@ class SearchSchema(Schema):
     from_place = UnicodeString(if_missing=None)
 
     chained_validators = [DateAfterDateValidator('start_date', 'end_date')]
+
+
+class BatchSearchSchema(SearchSchema):
+    """Search schema for searching campsites in several parks."""
+    park_name = ForEach(UnicodeString(not_empty=True), not_empty=True)
+
+
+class FlexibleSearchSchema(Schema):
+    """
+    Search schema for searching parks for a number of nights anywhere within
+    a window of dates.
+    """
+    window_start = DateValidator(not_empty=True)
+    window_end = DateValidator(not_empty=True)
+    nights = Int(min=1, max=30, not_empty=True)
+    drive_hours = Int(if_missing=0)
+    from_place = UnicodeString(if_missing=None)
+    include_sites = StringBool(if_missing=False)
+
+    chained_validators = [
+        DateAfterDateValidator('window_start', 'window_end'),
+        MaxDaysValidator('window_start', 'window_end', 366),
+    ]
+
+
+class CalendarSchema(Schema):
+    """Schema for a calendar of free campsites."""
+    start_date = DateValidator(not_empty=True)
+    end_date = DateValidator(not_empty=True)
+
+    chained_validators = [
+        DateAfterDateValidator('start_date', 'end_date'),
+        MaxDaysValidator('start_date', 'end_date', 366),
+    ]
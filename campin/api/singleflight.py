@@ -0,0 +1,88 @@
+"""
+Coalescing of identical concurrent work.
+
+When several requests need the same result at the same time, only the first
+one computes it and the others wait for that computation.
+"""
+import asyncio
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class SingleFlight(object):
+    """Share one in-flight computation between callers with the same key."""
+
+    def __init__(self):
+        # key -> future of the in-flight computation
+        self._calls = {}
+
+    async def do(self, key, fn):
+        """
+        Return the result of calling coroutine function fn, or of the call
+        already in flight for key.
+
+        :param key: Hashable key identifying the computation.
+        :param fn: Coroutine function without arguments.
+        """
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._track(key, future)
+        else:
+            log.debug('Joining in-flight call. {}'.format(key))
+
+        # A caller that is cancelled must not cancel the other callers.
+        return await asyncio.shield(future)
+
+    async def do_many(self, keys, fn):
+        """
+        Return a dictionary of key to result for each of keys, calling
+        coroutine function fn once for the keys that are not already in
+        flight.
+
+        :param keys: Iterable of hashable keys.
+        :param fn: Coroutine function that is passed a list of keys and
+            returns a dictionary of key to result. Keys missing from the
+            dictionary have a result of None.
+        """
+        keys = list(keys)
+        missing = [
+            key for key in dict.fromkeys(keys) if key not in self._calls
+        ]
+
+        if missing:
+            batch = asyncio.ensure_future(fn(missing))
+            for key in missing:
+                future = asyncio.Future()
+                self._track(key, future)
+                batch.add_done_callback(
+                    lambda batch, key=key, future=future: _set_from_batch(
+                        batch, key, future
+                    )
+                )
+
+        futures = [self._calls[key] for key in keys]
+        results = await asyncio.shield(asyncio.gather(*futures))
+        return dict(zip(keys, results))
+
+    def _track(self, key, future):
+        self._calls[key] = future
+
+        def done(_):
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+        future.add_done_callback(done)
+
+
+def _set_from_batch(batch, key, future):
+    """Resolve the future for key from the result of a batch call."""
+    if future.done():
+        return
+    if batch.cancelled():
+        future.cancel()
+    elif batch.exception() is not None:
+        future.set_exception(batch.exception())
+    else:
+        future.set_result(batch.result().get(key))
@@ -1,87 +1,570 @@
 import argparse
 import configparser
 import logging
+import multiprocessing
 import os
+import time
 
-from scrapy.crawler import CrawlerProcess
+import psycopg2
+from scrapy.crawler import Crawler, CrawlerProcess
+from scrapy.http import HtmlResponse
+from twisted.internet import defer, reactor
 
+from campin.scrape import archive, benchmark
 from campin.scrape.campsites import CampSiteSpider
 from campin.scrape.parks import OntarioParksSpider
+from campin.scrape.pipeline.persistence import IdCache, PipelinePool
 from campin.scrape.reservations import ReservationSpider
+from campin.scrape.schedule import (
+    RefreshScheduler, recent_scrapes, reserved_dates
+)
+from campin.scrape.workqueue import WorkQueue, create_sweep
 
 log = logging.getLogger(__name__)
 
 
-def scrape_parks():
-    settings = {
-        "USER_AGENT":
-            "Mozilla/5.0 (Windows NT 6.1) AppleWebKit/537.36 " +
-            "(KHTML, like Gecko) Chrome/41.0.2228.0 Safari/537.36",
-        'DOWNLOAD_DELAY':
-            0.1,
-        'CLOSESPIDER_ERRORCOUNT':
-            1,
-        'ITEM_PIPELINES': {
-            'campin.scrape.pipeline.ParkPipeline': 100,
-        }
+_park_settings = {
+    "USER_AGENT":
+        "Mozilla/5.0 (Windows NT 6.1) AppleWebKit/537.36 " +
+        "(KHTML, like Gecko) Chrome/41.0.2228.0 Safari/537.36",
+    'DOWNLOAD_DELAY':
+        0.1,
+    'CLOSESPIDER_ERRORCOUNT':
+        1,
+    'ITEM_PIPELINES': {
+        'campin.scrape.pipeline.ParkPipeline': 100,
     }
-    config = _config_file_settings()
+}
+
+# Reservation and campsite crawls throttle searches and campsite details with
+# campin.scrape.throttle.AdaptiveThrottle. Their other requests keep the fixed
+# DOWNLOAD_DELAY.
+_reservation_settings = {
+    "USER_AGENT":
+        "Mozilla/5.0 (Windows NT 6.1) AppleWebKit/537.36 " +
+        "(KHTML, like Gecko) Chrome/41.0.2228.0 Safari/537.36",
+    'DOWNLOAD_DELAY':
+        0.5,
+    'ADAPTIVE_THROTTLE_ENABLED':
+        True,
+    'DOWNLOADER_MIDDLEWARES': {
+        'campin.scrape.throttle.AdaptiveThrottle': 950,
+    },
+    'ITEM_PIPELINES': {
+        'campin.scrape.pipeline.ReservationPipeline': 100,
+    },
+}
+
+_site_settings = {
+    "USER_AGENT":
+        "Mozilla/5.0 (Windows NT 6.1) AppleWebKit/537.36 " +
+        "(KHTML, like Gecko) Chrome/41.0.2228.0 Safari/537.36",
+    'DOWNLOAD_DELAY':
+        0.2,
+    'ADAPTIVE_THROTTLE_ENABLED':
+        True,
+    'DOWNLOADER_MIDDLEWARES': {
+        'campin.scrape.throttle.AdaptiveThrottle': 950,
+    },
+    'CLOSESPIDER_ERRORCOUNT':
+        1,
+    'ITEM_PIPELINES': {
+        'scrapy.pipelines.images.ImagesPipeline': 1,
+        'campin.scrape.pipeline.CampSitePipeline': 100,
+    },
+    'IMAGES_STORE': 'images'
+}
+
+# Crawls of scrape_all, in the order they run
+_stages = ('parks', 'sites', 'reservations')
+
+
+def scrape_parks():
+    settings = dict(_park_settings)
+    parser = _argument_parser()
+    _add_record_argument(parser)
+    args = parser.parse_args()
+    config = _config_file_settings(args)
     db_settings = _parse_db_settings(config)
+    settings['DB_POOL_SIZE'] = _pool_size(config)
+    if args.record:
+        settings.update(_record_settings(parser, args.record))
     crawler = CrawlerProcess(settings)
     crawler.crawl(OntarioParksSpider, db_settings, config['gmaps.apikey'])
     crawler.start()
 
 
 def scrape_reservations():
-    settings = {
-        "USER_AGENT":
-            "Mozilla/5.0 (Windows NT 6.1) AppleWebKit/537.36 " +
-            "(KHTML, like Gecko) Chrome/41.0.2228.0 Safari/537.36",
-        'DOWNLOAD_DELAY':
-            0.5,
-        'CLOSESPIDER_ERRORCOUNT':
-            1,
-        'ITEM_PIPELINES': {
-            'campin.scrape.pipeline.ReservationPipeline': 100,
-        },
-    }
-    config = _config_file_settings()
+    settings = dict(_reservation_settings)
+    parser = _argument_parser()
+    _add_record_argument(parser)
+    _add_parse_processes_argument(parser)
+    parser.add_argument(
+        '--nights',
+        type=int,
+        default=1,
+        help='Most nights searched by each request. Nights that had no '
+             'reservations are searched together, so stays that are free for '
+             'every site cover several dates with one request.'
+    )
+    parser.add_argument(
+        '--budget',
+        type=int,
+        help='Number of park and date searches in a crawl. Searches are '
+             'chosen by how soon the date is, how often it has changed and '
+             'how long since it was scraped.'
+    )
+    parser.add_argument(
+        '--continuous',
+        action='store_true',
+        help='Start another crawl with the --budget when a crawl finishes.'
+    )
+    parser.add_argument(
+        '--skip-hours',
+        type=float,
+        help='Skip parks and dates that were scraped in this many hours, so '
+             'a restarted crawl continues where it stopped.'
+    )
+    parser.add_argument(
+        '--max-errors',
+        type=int,
+        default=1,
+        help='Close the crawl after this many errors. 0 to never close.'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of crawler processes that share the searches of a sweep.'
+    )
+    parser.add_argument(
+        '--sweep',
+        type=int,
+        help='Id of a sweep to work on, to add workers from another machine.'
+    )
+    args = parser.parse_args()
+    if args.continuous and (args.workers > 1 or args.sweep):
+        parser.error('--continuous can not be used with --workers or --sweep')
+    config = _config_file_settings(args)
+    db_settings = _parse_db_settings(config)
+
+    settings['DB_POOL_SIZE'] = _pool_size(config)
+    settings['CLOSESPIDER_ERRORCOUNT'] = args.max_errors
+    settings['PARSE_PROCESSES'] = args.parse_processes
+    if args.record:
+        settings.update(_record_settings(parser, args.record))
+
+    if args.workers == 1:
+        _crawl_reservations(settings, db_settings, args, args.sweep)
+        return
+
+    sweep_id = args.sweep or _load(db_settings, create_sweep)
+    log.info('Sweep {}. Starting {} workers.'.format(sweep_id, args.workers))
+    # Each worker needs its own reactor, so workers are started in new
+    # interpreters instead of forked.
+    context = multiprocessing.get_context('spawn')
+    workers = [
+        context.Process(
+            target=_crawl_reservations,
+            args=(settings, db_settings, args, sweep_id)
+        )
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def _crawl_reservations(settings, db_settings, args, sweep_id=None):
+    """
+    Run reservation crawls in this process until they are done.
+
+    :param settings: Scrapy settings.
+    :param db_settings: Database connection settings.
+    :param args: Parsed ``scrape_reservations`` arguments.
+    :param sweep_id: Id of the sweep whose searches are claimed from the work
+        queue, or None to make every search in this process.
+    """
+    process = CrawlerProcess(settings)
+
+    @defer.inlineCallbacks
+    def crawl():
+        try:
+            while True:
+                kwargs = {'nights': args.nights}
+                if args.record:
+                    # Searches are for the same dates when replayed
+                    kwargs['today'] = archive.recorded_date(args.record)
+                if args.skip_hours:
+                    kwargs['completed'] = _load(
+                        db_settings, recent_scrapes, args.skip_hours
+                    )
+                if args.budget:
+                    kwargs['scheduler'] = _load(
+                        db_settings, RefreshScheduler.load
+                    )
+                    kwargs['budget'] = args.budget
+                if args.nights > 1:
+                    kwargs['reserved'] = _load(db_settings, reserved_dates)
+                if sweep_id is not None:
+                    kwargs['work_queue'] = WorkQueue(db_settings, sweep_id)
+
+                crawler = process.create_crawler(ReservationSpider)
+                yield process.crawl(crawler, db_settings, **kwargs)
+
+                if not (args.budget and args.continuous):
+                    break
+        finally:
+            reactor.stop()
+
+    crawl()
+    process.start(stop_after_crawl=False)
+
+
+def scrape_sites():
+    settings = dict(_site_settings)
+    parser = _argument_parser()
+    _add_record_argument(parser)
+    _add_parse_processes_argument(parser)
+    args = parser.parse_args()
+    config = _config_file_settings(args)
     db_settings = _parse_db_settings(config)
+
+    settings['DB_POOL_SIZE'] = _pool_size(config)
+    settings['PARSE_PROCESSES'] = args.parse_processes
+
+    today = None
+    if args.record:
+        settings.update(_record_settings(parser, args.record))
+        today = archive.recorded_date(args.record)
+
     crawler = CrawlerProcess(settings)
-    crawler.crawl(ReservationSpider, db_settings)
+    crawler.crawl(CampSiteSpider, db_settings, today=today)
     crawler.start()
 
 
-def scrape_sites():
-    settings = {
-        "USER_AGENT":
-            "Mozilla/5.0 (Windows NT 6.1) AppleWebKit/537.36 " +
-            "(KHTML, like Gecko) Chrome/41.0.2228.0 Safari/537.36",
-        'DOWNLOAD_DELAY':
-            0.2,
-        'CLOSESPIDER_ERRORCOUNT':
-            1,
-        'ITEM_PIPELINES': {
-            'scrapy.pipelines.images.ImagesPipeline': 1,
-            'campin.scrape.pipeline.CampSitePipeline': 100,
-        },
-        'IMAGES_STORE': 'images'
+def scrape_all():
+    """
+    Scrape parks, campsites and reservations in one process.
+
+    The crawls share the reactor, a pool of database connections and the
+    cache of park and campsite ids. Campsites are scraped after parks, and
+    reservations after campsites, so they are saved with the ids of the
+    parks and campsites found before them.
+    """
+    parser = _argument_parser()
+    parser.add_argument(
+        '--stages',
+        nargs='+',
+        choices=_stages,
+        default=list(_stages),
+        help='Crawls to run. Defaults to every crawl.'
+    )
+    parser.add_argument(
+        '--overlap',
+        action='store_true',
+        help='Scrape reservations while parks are scraped from '
+             'ontarioparks.com, and campsites after both. Campsites found '
+             'by this scrape get their reservations in the next scrape.'
+    )
+    parser.add_argument(
+        '--nights',
+        type=int,
+        default=1,
+        help='Most nights searched by each reservation request.'
+    )
+    parser.add_argument(
+        '--budget',
+        type=int,
+        help='Number of park and date searches of the reservation crawl.'
+    )
+    parser.add_argument(
+        '--skip-hours',
+        type=float,
+        help='Skip parks and dates that were scraped in this many hours.'
+    )
+    _add_parse_processes_argument(parser)
+    args = parser.parse_args()
+    config = _config_file_settings(args)
+    db_settings = _parse_db_settings(config)
+
+    pool = PipelinePool(db_settings, _pool_size(config))
+    ids = IdCache(pool.connections)
+    reservation_kwargs = {'nights': args.nights}
+    if args.nights > 1:
+        reservation_kwargs['reserved'] = _load(db_settings, reserved_dates)
+    if args.skip_hours:
+        reservation_kwargs['completed'] = _load(
+            db_settings, recent_scrapes, args.skip_hours
+        )
+    if args.budget:
+        reservation_kwargs['scheduler'] = _load(
+            db_settings, RefreshScheduler.load
+        )
+        reservation_kwargs['budget'] = args.budget
+
+    # Stage -> spider class, Scrapy settings, spider arguments
+    stages = {
+        'parks': (
+            OntarioParksSpider,
+            _park_settings,
+            dict(gmaps_apikey=config['gmaps.apikey'], db_pool=pool)
+        ),
+        'sites': (
+            CampSiteSpider,
+            dict(_site_settings, PARSE_PROCESSES=args.parse_processes),
+            dict(db_pool=pool, id_cache=ids)
+        ),
+        'reservations': (
+            ReservationSpider,
+            dict(
+                _reservation_settings,
+                CLOSESPIDER_ERRORCOUNT=1,
+                PARSE_PROCESSES=args.parse_processes
+            ),
+            dict(reservation_kwargs, db_pool=pool, id_cache=ids)
+        ),
     }
+    process = CrawlerProcess()
+    # Stage -> seconds and stats of its crawl
+    timings = {}
 
+    def crawl(stage):
+        spidercls, settings, kwargs = stages[stage]
+        crawler = Crawler(spidercls, settings)
+        started = time.perf_counter()
+        log.info('Starting {} crawl.'.format(stage))
+
+        def finished(result):
+            timings[stage] = (time.perf_counter() - started, crawler.stats)
+            log.info('Finished {} crawl in {:.1f} seconds.'.format(
+                stage, timings[stage][0]
+            ))
+            return result
+
+        d = process.crawl(crawler, db_settings, **kwargs)
+        d.addBoth(finished)
+        return d
+
+    @defer.inlineCallbacks
+    def run():
+        try:
+            # The pool stays open between crawls, and the ids are loaded once.
+            yield pool.start()
+            yield ids.load()
+            if args.overlap and 'reservations' in args.stages:
+                # Campsites and reservations are scraped from the same site,
+                # so only the parks crawl runs with the reservation crawl.
+                reservations = crawl('reservations')
+                if 'parks' in args.stages:
+                    yield crawl('parks')
+                yield reservations
+                if 'sites' in args.stages:
+                    yield crawl('sites')
+            else:
+                for stage in _stages:
+                    if stage in args.stages:
+                        yield crawl(stage)
+            yield pool.close()
+        finally:
+            reactor.stop()
+
+    started = time.perf_counter()
+    run()
+    process.start(stop_after_crawl=False)
+
+    for stage in _stages:
+        if stage not in timings:
+            continue
+        seconds, stats = timings[stage]
+        print('{}: {:.1f}s, {} pages, {} items, {}'.format(
+            stage,
+            seconds,
+            stats.get_value('response_received_count', 0),
+            stats.get_value('item_scraped_count', 0),
+            stats.get_value('finish_reason')
+        ))
+    print('total: {:.1f}s'.format(time.perf_counter() - started))
+
+
+def rebuild_availability():
+    """
+    Rebuild the counts of free campsites per park, campground and date from 
+    the reservations.
+    """
     config = _config_file_settings()
     db_settings = _parse_db_settings(config)
 
-    crawler = CrawlerProcess(settings)
-    crawler.crawl(CampSiteSpider, db_settings)
-    crawler.start()
+    conn = _connect(db_settings)
+    try:
+        with conn:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT rebuild_park_date_availability()')
+    finally:
+        conn.close()
+    log.info('Rebuilt park date availability.')
+
+
+def benchmark_scrape():
+    """Print timings of the spiders' CPU work on generated pages."""
+    parser = argparse.ArgumentParser(
+        description='Benchmark scraping without network access'
+    )
+    subparsers = parser.add_subparsers(dest='benchmark')
+    subparsers.required = True
+
+    forms = subparsers.add_parser(
+        'forms', help='Building the search requests of the reservation form.'
+    )
+    forms.add_argument('--parks', type=int, default=100)
+    forms.add_argument('--dates', type=int, default=10)
+    forms.add_argument('--view-state-size', type=int, default=100000)
+
+    tables = subparsers.add_parser(
+        'tables', help='Reading the campsite table of a park page.'
+    )
+    tables.add_argument('--sites', type=int, default=1000)
+    tables.add_argument(
+        '--page',
+        help='Saved park page to read instead of a generated page.'
+    )
+
+    replay = subparsers.add_parser(
+        'replay',
+        help='Crawling responses recorded with --record, saving the items to '
+             'the database in the config file.'
+    )
+    replay.add_argument('spider', choices=('parks', 'sites', 'reservations'))
+    replay.add_argument('archive', metavar='ARCHIVE')
+    replay.add_argument('config_file', metavar='CONFIG_FILE')
+    args = parser.parse_args()
+
+    if args.benchmark == 'forms':
+        response = benchmark.landing_page(args.parks, args.view_state_size)
+        timings = benchmark.form_requests(response, args.dates)
+        print('Requests: {}'.format(timings['requests']))
+        for name in ('from_response', 'template'):
+            print('{}: {:.3f}s, {:.1f}us per request'.format(
+                name,
+                timings[name],
+                timings[name] / timings['requests'] * 1000000
+            ))
+    elif args.benchmark == 'tables':
+        if args.page:
+            with open(args.page, 'rb') as f:
+                response = HtmlResponse(
+                    'file://' + os.path.abspath(args.page), body=f.read()
+                )
+        else:
+            response = benchmark.park_page(args.sites)
+        timings = benchmark.table_parsing(response)
+        print('Rows: {}'.format(timings['rows']))
+        for name in ('selectors', 'compiled'):
+            print('{}: {:.4f}s'.format(name, timings[name]))
+    elif args.benchmark == 'replay':
+        _benchmark_replay(args)
+
+
+def _benchmark_replay(args):
+    config = _config_file_settings(args)
+    db_settings = _parse_db_settings(config)
+    today = archive.recorded_date(args.archive)
+
+    if args.spider == 'parks':
+        settings = dict(_park_settings)
+        spider_args = (OntarioParksSpider, db_settings, config['gmaps.apikey'])
+        spider_kwargs = {}
+    elif args.spider == 'sites':
+        settings = dict(_site_settings)
+        spider_args = (CampSiteSpider, db_settings)
+        spider_kwargs = {'today': today}
+    else:
+        settings = dict(_reservation_settings)
+        spider_args = (ReservationSpider, db_settings)
+        spider_kwargs = {'today': today}
+
+    settings.update(archive.replay_settings(args.archive))
+    settings['DB_POOL_SIZE'] = _pool_size(config)
+    settings['CLOSESPIDER_ERRORCOUNT'] = 0
+    settings['ITEM_PIPELINES'] = dict(settings['ITEM_PIPELINES'])
+    settings['ITEM_PIPELINES']['campin.scrape.benchmark.PersistenceTimer'] = 0
+
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(spider_args[0])
+    process.crawl(crawler, *spider_args[1:], **spider_kwargs)
+    process.start()
+
+    rates = benchmark.crawl_rates(crawler.stats)
+    print('Pages: {pages} in {elapsed:.1f}s, {pages_per_second:.1f}/s'.format(
+        **rates
+    ))
+    print('Items: {items}, {items_per_second:.1f}/s'.format(**rates))
+    print(
+        'Persistence latency: mean {latency_mean:.4f}s, '
+        'p95 {latency_p95:.4f}s, max {latency_max:.4f}s'.format(**rates)
+    )
+    if rates['flushed_pages']:
+        print(
+            'Flushed pages: {flushed_pages} in {flush_seconds:.1f}s, '
+            '{flush_seconds_per_page:.4f}s per page'.format(**rates)
+        )
+
+
+def _load(db_settings, load, *args):
+    """Return the result of calling load with a cursor and args."""
+    conn = _connect(db_settings)
+    try:
+        with conn:
+            with conn.cursor() as cursor:
+                return load(cursor, *args)
+    finally:
+        conn.close()
+
+
+def _connect(db_settings):
+    """Return a psycopg2 connection."""
+    return psycopg2.connect(**db_settings)
+
+
+def _add_parse_processes_argument(parser):
+    parser.add_argument(
+        '--parse-processes',
+        type=int,
+        default=0,
+        help='Number of processes that parse park pages. 0 to parse in the '
+             'crawler process.'
+    )
+
+
+def _add_record_argument(parser):
+    parser.add_argument(
+        '--record',
+        metavar='ARCHIVE',
+        help='Save every response to this new or empty directory, to replay '
+             'with benchmark_scrape replay.'
+    )
+
+
+def _record_settings(parser, path):
+    """Return the settings that record to path, or exit if it is in use."""
+    try:
+        return archive.record_settings(path)
+    except ValueError as e:
+        parser.error(str(e))
 
 
-def _config_file_settings():
+def _argument_parser():
     parser = argparse.ArgumentParser(
         description='Scrape Ontario Parks'
     )
     parser.add_argument('config_file', metavar='CONFIG_FILE')
-    args = parser.parse_args()
+    return parser
+
+
+def _config_file_settings(args=None):
+    if args is None:
+        args = _argument_parser().parse_args()
     config_parser = configparser.ConfigParser()
     with open(os.path.abspath(args.config_file), 'r') as f:
         config_parser.read_file(f)
@@ -89,8 +572,19 @@ def _config_file_settings():
 
 
 def _parse_db_settings(settings, prefix='db.'):
+    """
+    Return the connection arguments of the ``db.*`` settings. ``db.pool_size``
+    isn't a connection argument, see _pool_size.
+    """
     return {
         k[len(prefix):]: v
         for k, v in settings.items()
-        if k.startswith('db.')
+        if k.startswith('db.') and k != prefix + 'pool_size'
     }
+
+
+def _pool_size(settings, prefix='db.'):
+    """Return the number of connections of the scrape pipelines' pools."""
+    return int(
+        settings.get(prefix + 'pool_size') or PipelinePool.default_size
+    )
@@ -0,0 +1,71 @@
+"""
+Recording responses to a local archive and replaying them without network
+access.
+
+The archive is Scrapy's HTTP cache, stored on the file system with a policy
+that keeps every response. Searches depend on the date the crawl was made,
+so the date is saved with the archive and replayed crawls search the same
+dates.
+"""
+import json
+import logging
+import os
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+_manifest_name = 'campin.json'
+
+
+def record_settings(path):
+    """
+    Return Scrapy settings that save every response to a new archive.
+
+    :raises ValueError: If path is a directory that isn't empty. Responses
+        already in an archive would be served instead of downloaded, with the
+        date of the earlier recording.
+    """
+    path = os.path.abspath(path)
+    if os.path.isdir(path) and os.listdir(path):
+        raise ValueError('Archive {} is not empty.'.format(path))
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, _manifest_name), 'w') as f:
+        json.dump({'today': datetime.now().strftime('%Y-%m-%d')}, f)
+    log.info('Recording responses to {}.'.format(path))
+    return _cache_settings(path)
+
+
+def replay_settings(path):
+    """
+    Return Scrapy settings that serve responses from the archive. Requests
+    that weren't recorded are ignored.
+    """
+    path = os.path.abspath(path)
+    log.info('Replaying responses from {}.'.format(path))
+    settings = _cache_settings(path)
+    settings.update({
+        'HTTPCACHE_IGNORE_MISSING': True,
+        'DOWNLOAD_DELAY': 0,
+        'AUTOTHROTTLE_ENABLED': False,
+        'ADAPTIVE_THROTTLE_ENABLED': False,
+    })
+    return settings
+
+
+def recorded_date(path):
+    """Return the datetime of the day the archive was recorded."""
+    with open(os.path.join(os.path.abspath(path), _manifest_name)) as f:
+        return datetime.strptime(json.load(f)['today'], '%Y-%m-%d')
+
+
+def _cache_settings(path):
+    return {
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_DIR': path,
+        'HTTPCACHE_POLICY': 'scrapy.extensions.httpcache.DummyPolicy',
+        'HTTPCACHE_STORAGE':
+            'scrapy.extensions.httpcache.FilesystemCacheStorage',
+        'HTTPCACHE_EXPIRATION_SECS': 0,
+        'HTTPCACHE_IGNORE_HTTP_CODES': [],
+    }
+
@@ -0,0 +1,256 @@
+"""
+Benchmarks of the spiders and pipelines.
+
+Micro-benchmarks use pages generated to look like the reservation site's
+pages. Crawls are benchmarked by replaying an archive of recorded responses,
+see :mod:`campin.scrape.archive`. Neither needs network access.
+"""
+import base64
+import os
+import time
+import timeit
+from datetime import datetime, timedelta
+
+import scrapy
+from scrapy import signals
+from scrapy.http import HtmlResponse
+
+from campin.scrape import sitetable
+from campin.scrape.form import FormTemplate
+
+_landing_url = 'https://reservations.ontarioparks.com/Algonquin-Achray?List'
+_park_url = 'https://reservations.ontarioparks.com/Viewer.aspx'
+
+
+def landing_page(parks=100, view_state_size=100000):
+    """
+    Return a response with the reservation form of the landing page.
+
+    :param parks: Number of parks in the location list.
+    :param view_state_size: Bytes of the ASP.NET view state.
+    """
+    view_state = base64.b64encode(os.urandom(view_state_size)).decode('ascii')
+    options = ''.join(
+        '<option value="-{0}">Park {0}</option>'.format(i)
+        for i in range(parks)
+    )
+    body = """
+        <html><body>
+        <form name="MainForm" method="post" action="Viewer.aspx">
+          <input type="hidden" name="__VIEWSTATE" value="{view_state}">
+          <input type="hidden" name="__EVENTVALIDATION" value="{validation}">
+          <select name="ctl00$MainContentPlaceHolder$LocationList">
+            <option value="-1">Ontario Parks</option>{options}
+          </select>
+          <select name="ctl00$MainContentPlaceHolder$MapList">
+            <option value="0" selected>All Campgrounds</option>
+          </select>
+          <input type="text" name="selArrMth" value="">
+          <input type="text" name="selArrDay" value="">
+          <input type="hidden" name="txtArrDateHidden" value="">
+          <input type="text" name="selNumNights" value="1">
+          <input type="text" name="selEquipmentSub" value="">
+          <input type="text" name="selPartySize" value="1">
+          <input type="submit" name="btnSearch" value="Search">
+        </form>
+        </body></html>
+    """.format(
+        view_state=view_state,
+        validation=view_state[:200],
+        options=options
+    )
+    return HtmlResponse(_landing_url, body=body, encoding='utf-8')
+
+
+def form_requests(response, dates=10, repeat=3):
+    """
+    Return the best seconds taken to build a search request for each park
+    and date with ``FormRequest.from_response`` and with a
+    :class:`FormTemplate`.
+    """
+    parks = response.css(
+        'select[name="ctl00$MainContentPlaceHolder$LocationList"] '
+        'option::attr(value)'
+    ).extract()
+    reserve_dates = [
+        datetime(2017, 6, 1) + timedelta(days=i) for i in range(dates)
+    ]
+
+    def formdata(park_id, reserve_date):
+        return {
+            'ctl00$MainContentPlaceHolder$LocationList': park_id,
+            'selArrMth': reserve_date.strftime(
+                '%a %b 01 %Y 00:00:00 GMT-0400 (EDT)'
+            ),
+            'selArrDay': reserve_date.strftime(
+                '%a %b %d %Y 00:00:00 GMT-0400 (EDT)'
+            ),
+            'txtArrDateHidden': reserve_date.strftime('%Y-%m-%d'),
+            'selNumNights': '1',
+            'selEquipmentSub': 'Single Tent/Shelter',
+            'selPartySize': '1'
+        }
+
+    def from_response():
+        for reserve_date in reserve_dates:
+            for park_id in parks:
+                scrapy.FormRequest.from_response(
+                    response,
+                    formname='MainForm',
+                    formdata=formdata(park_id, reserve_date),
+                    dont_click=True
+                )
+
+    def template():
+        form = FormTemplate.from_response(
+            response,
+            formname='MainForm',
+            dont_click=True
+        )
+        for reserve_date in reserve_dates:
+            for park_id in parks:
+                form.request(formdata(park_id, reserve_date))
+
+    return {
+        'requests': len(parks) * len(reserve_dates),
+        'from_response': min(timeit.repeat(from_response, number=1, repeat=repeat)),
+        'template': min(timeit.repeat(template, number=1, repeat=repeat)),
+    }
+
+
+def park_page(sites=1000):
+    """
+    Return a response of a park page with a campsite table.
+
+    :param sites: Number of campsites in the table.
+    """
+    rows = ''.join(
+        """
+        <tr>
+          <td><img src="site.gif"></td>
+          <td><a href="javascript:SelectRce('-2147483{0}','0','-2147{0}');">
+            {0} (Site)</a></td>
+          <td>Single Tent</td>
+          <td>{1}</td>
+        </tr>
+        """.format(i, 'Reserved' if i % 3 else '<a href="#">Reserve!</a>')
+        for i in range(sites)
+    )
+    body = """
+        <html><body>
+        <table class="list_new">
+          <thead><tr><th></th><th>Site</th><th>Type</th><th>Status</th></tr></thead>
+          <tbody>{rows}</tbody>
+        </table>
+        </body></html>
+    """.format(rows=rows)
+    return HtmlResponse(_park_url, body=body, encoding='utf-8')
+
+
+def table_parsing(response, repeat=5):
+    """
+    Return the rows of the campsite table and the best seconds taken to read
+    them with CSS selectors for every row, and with :mod:`sitetable`.
+    """
+    def selectors():
+        rows = []
+        for row in response.css('.list_new').css('tbody tr'):
+            cells = list(row.css('td'))
+            if not cells:
+                continue
+            site_number = cells[1].css('a::text').extract()[0].split()[0].strip()
+            site_status = cells[3].css('a::text')
+            if not site_status:
+                site_status = cells[3].xpath('text()')
+            rows.append((site_number, site_status.extract()[0]))
+        return rows
+
+    def compiled():
+        return sitetable.reservation_rows(
+            sitetable.site_tables(response.selector.root)
+        )
+
+    # Parse the document before timing, the spiders get it parsed.
+    response.selector
+    return {
+        'rows': len(compiled()),
+        'selectors': min(timeit.repeat(selectors, number=1, repeat=repeat)),
+        'compiled': min(timeit.repeat(compiled, number=1, repeat=repeat)),
+    }
+
+
+class PersistenceTimer(object):
+    """
+    Item pipeline that measures the seconds from an item entering the item
+    pipelines until every pipeline has processed it.
+
+    Use it as the first pipeline. The mean, 95th percentile and maximum are
+    saved in the crawl's stats.
+
+    Reservation pages are buffered by the pipeline, so most pages don't wait
+    on the database. Their persistence is measured by the pipeline's flushes,
+    see :func:`crawl_rates`.
+    """
+
+    def __init__(self, stats):
+        self._stats = stats
+        # id of item -> time it entered the pipelines
+        self._started = {}
+        self._latencies = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        timer = cls(crawler.stats)
+        crawler.signals.connect(timer.item_done, signals.item_scraped)
+        crawler.signals.connect(timer.item_done, signals.item_dropped)
+        crawler.signals.connect(timer.spider_closed, signals.spider_closed)
+        return timer
+
+    def process_item(self, item, spider):
+        self._started[id(item)] = time.perf_counter()
+        return item
+
+    def item_done(self, item, spider):
+        started = self._started.pop(id(item), None)
+        if started is not None:
+            self._latencies.append(time.perf_counter() - started)
+
+    def spider_closed(self, spider):
+        if not self._latencies:
+            return
+        latencies = sorted(self._latencies)
+        self._stats.set_value(
+            'persistence/latency_mean', sum(latencies) / len(latencies)
+        )
+        self._stats.set_value(
+            'persistence/latency_p95', latencies[int(len(latencies) * 0.95)]
+        )
+        self._stats.set_value('persistence/latency_max', latencies[-1])
+
+
+def crawl_rates(stats):
+    """
+    Return pages per second, items per second, the persistence latencies and
+    the seconds to save each buffered reservation page of a crawl's stats.
+    """
+    elapsed = (
+        stats.get_value('finish_time') - stats.get_value('start_time')
+    ).total_seconds()
+    rates = {
+        'elapsed': elapsed,
+        'pages': stats.get_value('response_received_count', 0),
+        'items': stats.get_value('item_scraped_count', 0),
+    }
+    rates['pages_per_second'] = rates['pages'] / elapsed if elapsed else 0
+    rates['items_per_second'] = rates['items'] / elapsed if elapsed else 0
+    for name in ('mean', 'p95', 'max'):
+        rates['latency_' + name] = stats.get_value(
+            'persistence/latency_' + name, 0
+        )
+    rates['flushed_pages'] = stats.get_value('reservations/flushed_pages', 0)
+    rates['flush_seconds'] = stats.get_value('reservations/flush_seconds', 0)
+    rates['flush_seconds_per_page'] = (
+        rates['flush_seconds'] / rates['flushed_pages']
+        if rates['flushed_pages'] else 0
+    )
+    return rates
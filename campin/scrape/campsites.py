@@ -6,8 +6,10 @@ import re
 
 import scrapy
 
+from campin.scrape import pages, sitetable
+from campin.scrape.form import FormTemplate
 from campin.scrape.items import CampSiteItem
-from campin.scrape.util import text
+from campin.scrape.pages import ParsePool
 
 log = logging.getLogger(__name__)
 
@@ -20,14 +22,25 @@ class CampSiteSpider(scrapy.Spider):
     start_urls = ['https://reservations.ontarioparks.com/Algonquin-Achray?List']
     park_post_url = 'https://reservations.OntarioParks.com/Viewer.aspx'
 
-    def __init__(self, db_settings):
+    def __init__(self, db_settings, today=None, db_pool=None, id_cache=None):
         super().__init__()
         # db_settings will be used by Pipeline.
         self.db_settings = db_settings
-        current_year = datetime.now().year
+        # PipelinePool and IdCache shared with other crawls, or None for the
+        # pipeline to make its own.
+        self.db_pool = db_pool
+        self.id_cache = id_cache
+        current_year = (today or datetime.now()).year
         # Date to use when getting campsite information. This is necessary
         # to search for campsites, because it's really a search for reservations.
         self._check_date = datetime(current_year, 6, 1)
+        self._parse_pool = ParsePool()
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider._parse_pool = ParsePool.from_crawler(crawler)
+        return spider
 
     def parse(self, response):
         """
@@ -42,6 +55,11 @@ class CampSiteSpider(scrapy.Spider):
         date_str = self._check_date.strftime(
             '%a %b %m %Y 00:00:00 GMT-0400 (EDT)'
         )
+        form = FormTemplate.from_response(
+            response,
+            formname='MainForm',
+            dont_click=True
+        )
 
         # Each park in the reserve form
         for park_option in response.css(
@@ -69,11 +87,8 @@ class CampSiteSpider(scrapy.Spider):
                 'NumberOfNights': nights
             }
 
-            request = scrapy.FormRequest.from_response(
-                response,
-                formname='MainForm',
-                formdata=form_params,
-                dont_click=True,
+            request = form.request(
+                form_params,
                 callback=self._park_callback,
                 cookies=cookies,
                 meta={'reserve_date': self._check_date}
@@ -82,21 +97,30 @@ class CampSiteSpider(scrapy.Spider):
 
     def _park_callback(self, response):
         """
-        Generate :class:`CampSiteItem` and :class:`ReservationItem` for the park
-        that we are scraping
+        Return a Deferred that fires with a list of requests that populate
+        the :class:`CampSiteItem` of each campsite of the park that we are
+        scraping.
+
+        The page is parsed by the spider's :class:`ParsePool`.
         """
+        d = self._parse_pool.run(
+            pages.park_page, response, sitetable.campsite_rows
+        )
+        d.addCallback(lambda page: list(self._park_results(response, page)))
+        return d
+
+    def _park_results(self, response, page):
         parent_name, park_name, campground_name = self._park_names_selected(
-            response
+            page
         )
         reserve_date = response.meta['reserve_date']
 
         log.debug('On page for park: {}'.format(park_name))
 
-        if response.css('#viewAvailabilityMsg'):
+        if page.area_links is not None:
             # A campground area must be chosen with a new request
-            area_table = response.css('.list_new')
-            for anchor in area_table.css('a::attr("href")'):
-                url = response.urljoin(anchor.extract())
+            for _, href in page.area_links:
+                url = response.urljoin(href)
 
                 request = scrapy.Request(url, callback=self._park_callback)
                 request.meta['reserve_date'] = reserve_date
@@ -106,49 +130,32 @@ class CampSiteSpider(scrapy.Spider):
             # parks will be parsed with requests in the above loop
             return
 
-        site_table = response.css('.list_new')
-        for row in site_table.css('tbody tr'):
-            cells = list(row.css('td'))
-            if not cells:
-                # header row
-                continue
-            # Table cell containing link to campsite details
-            site_cell = cells[1]
-            site_number = cells[1].css('a::text').extract()[0].split()[0].strip()
-
+        for site_number, site_type, site_links in page.rows or ():
             site = CampSiteItem()
             site['parent_park_name'] = parent_name
             site['park_name'] = park_name
             site['campground_name'] = campground_name
             site['site_number'] = site_number
-            site['site_type'] = cells[2].xpath('text()').extract()[0]
+            site['site_type'] = site_type
             site['details'] = {}
             site['images'] = []
             site['image_urls'] = []
 
-            pop_details = PopulateCampsiteDetails(site)
-            yield from pop_details.populate(site_cell)
+            pop_details = PopulateCampsiteDetails(site, self._parse_pool)
+            yield from pop_details.populate(site_links)
 
-    def _park_names_selected(self, response):
+    def _park_names_selected(self, page):
         """
         Find the park name, campground name, and parent park name from
-        the form selection.
+        the form selection of a :class:`ParkPage`.
         """
         parent_park_name = None
-        park_name = text(
-            response.css(
-                'select[name="ctl00$MainContentPlaceHolder$LocationList"] > option[selected]'
-            )
-        )
+        park_name = page.location_name
 
         if ' - ' in park_name:
             parent_park_name, park_name = park_name.split(' - ')
 
-        campground_name = text(
-            response.css(
-                'select[name="ctl00$MainContentPlaceHolder$MapList"] > option[selected]'
-            )
-        )
+        campground_name = page.campground_name
 
         if campground_name == 'All Campgrounds':
             campground_name = None
@@ -164,13 +171,16 @@ class CampSiteSpider(scrapy.Spider):
 class PopulateCampsiteDetails(object):
     """Populate details in the campsite item."""
 
-    def __init__(self, campsite):
+    def __init__(self, campsite, parse_pool=None):
         # self._campsite will be have details set as callbacks are called
         self._campsite = campsite
+        self._parse_pool = parse_pool or ParsePool()
 
-    def populate(self, site_cell):
+    def populate(self, site_links):
         """
         Return a request that will populate the campsite details on callback.
+
+        :param site_links: hrefs of the links in the site number cell.
         """
         log.debug('{} - {}. Populating site details.'.format(
             self._campsite['park_name'],
@@ -180,10 +190,9 @@ class PopulateCampsiteDetails(object):
             r"javascript:SelectRce\('([^']+)','([^']+)','([^']+)'\);"
         )
 
-        for anchor in site_cell.css('a::attr("href")'):
+        for jscall in site_links:
             # The javascript in the href contains the call to navigate to the
             # details page.
-            jscall = anchor.extract()
             # log.debug('JS Call: {}'.format(jscall))
             match = jscall_re.match(jscall)
             if not match:
@@ -196,13 +205,14 @@ class PopulateCampsiteDetails(object):
             rce_id = match.group(3) # named "r" in SelectRce
 
             def request_photos(response):
-                self._set_details(response)
                 pictures_url = 'https://reservations.ontarioparks.com/Pictures.aspx'
                 pictures_params = {'locId': loc_id, 'rceId': rce_id}
-                yield scrapy.Request(
+                d = self._set_details(response)
+                d.addCallback(lambda _: [scrapy.Request(
                     pictures_url + '?' + urlencode(pictures_params),
                     callback=self._set_photos
-                )
+                )])
+                return d
 
             yield scrapy.FormRequest(
                 'https://reservations.ontarioparks.com/Details.ashx',
@@ -215,19 +225,20 @@ class PopulateCampsiteDetails(object):
     def _set_details(self, response):
         """
         Set the details on the campsite item. 
-        """
-        details = {}
-        for row in response.css('table.rceDetails tbody tr'):
-            label = text(row.css('td.label'))
-            value = text(row.css('td.value'))
-            details[label] = value
 
-        log.debug('{} - {}. Found details.\n{}'.format(
-            self._campsite['park_name'],
-            self._campsite['site_number'],
-            details
-        ))
-        self._campsite['details'] = details
+        :return: Deferred that fires when the details are set.
+        """
+        def set_details(details):
+            log.debug('{} - {}. Found details.\n{}'.format(
+                self._campsite['park_name'],
+                self._campsite['site_number'],
+                details
+            ))
+            self._campsite['details'] = details
+
+        d = self._parse_pool.run(pages.campsite_details, response)
+        d.addCallback(set_details)
+        return d
 
     def _set_photos(self, response):
         """
@@ -0,0 +1,96 @@
+"""Reusable form submissions."""
+import logging
+from urllib.parse import parse_qsl, urlencode
+
+import scrapy
+
+log = logging.getLogger(__name__)
+
+
+class FormTemplate(object):
+    """
+    Form fields extracted once from a response and used to build many
+    requests that submit the form.
+
+    ``FormRequest.from_response`` parses the page's form and encodes every
+    field, including the ASP.NET view state, for each request. The template
+    keeps the fields that aren't changed already encoded, so a request only
+    encodes its own fields.
+    """
+
+    def __init__(self, url, method, fields, encoding='utf-8'):
+        """
+        :param url: URL the form is submitted to.
+        :param method: HTTP method of the form.
+        :param fields: List of field name and value of the form.
+        :param encoding: Encoding of the field names and values.
+        """
+        self.url = url
+        self.method = method.upper()
+        self._fields = fields
+        self._encoding = encoding
+        # Names of the fields a request sets -> the other fields, encoded
+        self._encoded = {}
+
+    @classmethod
+    def from_response(cls, response, **kwargs):
+        """
+        Return a template of a form in the response.
+
+        :param kwargs: Arguments of ``FormRequest.from_response`` that choose
+            the form and its fields, such as ``formname`` and ``dont_click``.
+        """
+        request = scrapy.FormRequest.from_response(response, **kwargs)
+        if request.method == 'POST':
+            query = request.body.decode(request.encoding)
+            url = request.url
+        else:
+            url, _, query = request.url.partition('?')
+        fields = parse_qsl(query, keep_blank_values=True)
+        log.debug('Form template of {} fields for {}.'.format(len(fields), url))
+        return cls(url, request.method, fields, request.encoding)
+
+    def request(self, formdata, **kwargs):
+        """
+        Return a request that submits the form with the fields in formdata.
+
+        :param formdata: Dictionary of field name to value. Fields of the form
+            with the same name are replaced.
+        :param kwargs: Other arguments of ``scrapy.Request``.
+        """
+        names = frozenset(formdata)
+        encoded = self._encoded.get(names)
+        if encoded is None:
+            encoded = self._encoded[names] = self._encode(
+                (name, value) for name, value in self._fields
+                if name not in names
+            )
+
+        query = '&'.join(
+            part for part in (encoded, self._encode(formdata.items())) if part
+        )
+        if self.method == 'POST':
+            headers = kwargs.pop('headers', None) or {}
+            headers.setdefault(
+                'Content-Type', 'application/x-www-form-urlencoded'
+            )
+            return scrapy.Request(
+                self.url,
+                method='POST',
+                body=query,
+                headers=headers,
+                encoding=self._encoding,
+                **kwargs
+            )
+        return scrapy.Request(
+            self.url + '?' + query,
+            method=self.method,
+            encoding=self._encoding,
+            **kwargs
+        )
+
+    def _encode(self, fields):
+        return urlencode([
+            (name.encode(self._encoding), value.encode(self._encoding))
+            for name, value in fields
+        ])
@@ -1,3 +1,5 @@
+from array import array
+
 import scrapy
 
 
@@ -40,10 +42,55 @@ class CampSiteItem(scrapy.Item):
     images = scrapy.Field()
 
 
-class ReservationItem(scrapy.Item):
-    campsite_id = scrapy.Field()
-    site_number = scrapy.Field()
+class ReservationRows(object):
+    """
+    Site numbers and reservation reasons of the rows of a reservation page.
+
+    Reasons are stored once per page and each row keeps the index of its
+    reason, so a page of a large park is a few compact sequences instead of
+    an item per row.
+    """
+    __slots__ = ('site_numbers', 'reasons', '_reason_indexes')
+
+    def __init__(self, rows=()):
+        """
+        :param rows: Iterable of site number and reason.
+        """
+        self.site_numbers = []
+        # Distinct reasons of the page
+        self.reasons = []
+        self._reason_indexes = array('H')
+        for site_number, reason in rows:
+            self.append(site_number, reason)
+
+    def append(self, site_number, reason):
+        try:
+            index = self.reasons.index(reason)
+        except ValueError:
+            index = len(self.reasons)
+            self.reasons.append(reason)
+        self.site_numbers.append(site_number)
+        self._reason_indexes.append(index)
+
+    def __len__(self):
+        return len(self.site_numbers)
+
+    def __iter__(self):
+        """Iterate over the site number and reason of each row."""
+        reasons = self.reasons
+        for site_number, index in zip(self.site_numbers, self._reason_indexes):
+            yield site_number, reasons[index]
+
+    def __repr__(self):
+        return '<ReservationRows sites={} reasons={}>'.format(
+            len(self), self.reasons
+        )
+
+
+class ReservationPageItem(scrapy.Item):
+    """All reservations listed on one park page for one date."""
     park_name = scrapy.Field()
+    campground_name = scrapy.Field()
     reserve_date = scrapy.Field()
-    reason = scrapy.Field()
-
+    # ReservationRows of the campsites listed on the page
+    sites = scrapy.Field()
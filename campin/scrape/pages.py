@@ -0,0 +1,167 @@
+"""
+Parsing of the reservation site's pages from response bodies.
+
+The functions take the body and encoding of a response and return plain
+values, so they can run in the worker processes of a :class:`ParsePool`.
+"""
+import logging
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from lxml import etree
+from scrapy import signals
+from twisted.internet import defer, reactor
+from twisted.python import failure
+
+from campin.scrape import sitetable
+
+log = logging.getLogger(__name__)
+
+ParkPage = namedtuple(
+    'ParkPage', ['location_name', 'campground_name', 'area_links', 'rows']
+)
+ParkPage.__doc__ = """
+Park page of the reservation site.
+
+location_name is the selected location, with the parent park name if there is
+one, and campground_name is the selected campground. area_links is a list of
+link text and href of the campground areas when an area must be chosen,
+otherwise None. rows are the campsite rows, or None when the page has no
+campsite table.
+"""
+
+_selected_option = etree.XPath(
+    '//select[@name=$name]/option[@selected]/text()', smart_strings=False
+)
+_availability_message = etree.XPath(
+    '//*[@id="viewAvailabilityMsg"]', smart_strings=False
+)
+_links = etree.XPath('.//a', smart_strings=False)
+_texts = etree.XPath('./text()', smart_strings=False)
+_details_rows = etree.XPath(
+    "//table[contains(concat(' ', normalize-space(@class), ' '), ' rceDetails ')]"
+    "//tbody//tr",
+    smart_strings=False
+)
+_details_cells = etree.XPath(
+    "./td[contains(concat(' ', normalize-space(@class), ' '), $name)]",
+    smart_strings=False
+)
+
+
+def park_page(body, encoding, read_rows):
+    """
+    Return a :class:`ParkPage`.
+
+    :param read_rows: Function of :mod:`sitetable` that reads the rows of the
+        campsite tables.
+    """
+    root = _parse(body, encoding)
+    if root is None:
+        return ParkPage('', None, None, None)
+
+    location_name = ''.join(_selected_option(
+        root, name='ctl00$MainContentPlaceHolder$LocationList'
+    ))
+    campground_name = ''.join(_selected_option(
+        root, name='ctl00$MainContentPlaceHolder$MapList'
+    ))
+    tables = sitetable.site_tables(root)
+
+    if _availability_message(root):
+        # A campground area must be chosen with a new request
+        area_links = [
+            (''.join(_texts(anchor)).strip(), anchor.get('href'))
+            for table in tables
+            for anchor in _links(table)
+        ]
+        return ParkPage(location_name, campground_name, area_links, None)
+
+    rows = read_rows(tables) if tables else None
+    return ParkPage(location_name, campground_name, None, rows)
+
+
+def campsite_details(body, encoding):
+    """Return a dictionary of label to value of a campsite details page."""
+    root = _parse(body, encoding)
+    if root is None:
+        return {}
+
+    details = {}
+    for row in _details_rows(root):
+        label = ''.join(
+            text for cell in _details_cells(row, name=' label ')
+            for text in _texts(cell)
+        )
+        value = ''.join(
+            text for cell in _details_cells(row, name=' value ')
+            for text in _texts(cell)
+        )
+        details[label] = value
+    return details
+
+
+def _parse(body, encoding):
+    if not body:
+        return None
+    return etree.fromstring(body, etree.HTMLParser(encoding=encoding))
+
+
+class ParsePool(object):
+    """
+    Runs page parsing functions in worker processes, so large pages don't
+    block the reactor and a crawler can use several cores.
+
+    Without processes the functions run on the reactor thread.
+    """
+
+    def __init__(self, processes=0):
+        """
+        :param processes: Number of worker processes. 0 to parse in this
+            process.
+        """
+        self._processes = processes
+        self._executor = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Return a pool sized by the ``PARSE_PROCESSES`` setting."""
+        pool = cls(crawler.settings.getint('PARSE_PROCESSES', 0))
+        crawler.signals.connect(pool.close, signals.spider_closed)
+        return pool
+
+    def run(self, f, response, *args):
+        """
+        Call f with the body and encoding of response and args.
+
+        :return: Deferred that fires with the result of f.
+        """
+        if not self._processes:
+            return defer.maybeDeferred(
+                f, response.body, response.encoding, *args
+            )
+
+        if self._executor is None:
+            log.info('Starting {} parse processes.'.format(self._processes))
+            self._executor = ProcessPoolExecutor(self._processes)
+
+        future = self._executor.submit(
+            f, response.body, response.encoding, *args
+        )
+        d = defer.Deferred()
+
+        def done(future):
+            # Called in a thread of the executor
+            exception = future.exception()
+            if exception is not None:
+                reactor.callFromThread(d.errback, failure.Failure(exception))
+            else:
+                reactor.callFromThread(d.callback, future.result())
+
+        future.add_done_callback(done)
+        return d
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
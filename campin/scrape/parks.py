@@ -22,10 +22,13 @@ class OntarioParksSpider(scrapy.Spider):
     name = 'ontarioparks'
     start_urls = ['http://www.ontarioparks.com/en']
 
-    def __init__(self, db_settings, gmaps_apikey):
+    def __init__(self, db_settings, gmaps_apikey, db_pool=None):
         super().__init__()
         self.db_settings = db_settings
         self.gmaps_apikey = gmaps_apikey
+        # PipelinePool shared with other crawls, or None for the pipeline to
+        # make its own.
+        self.db_pool = db_pool
 
     def parse(self, response):
         """
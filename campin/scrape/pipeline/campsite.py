@@ -3,9 +3,10 @@ import logging
 
 from psycopg2.extensions import register_adapter
 from psycopg2.extras import Json
-from txpostgres import txpostgres
 
-from campin.scrape.pipeline.persistence import CampSitePersistor
+from campin.scrape.pipeline.persistence import (
+    CampSitePersistor, IdCache, PipelinePool
+)
 
 log = logging.getLogger(__name__)
 register_adapter(dict, Json)
@@ -16,10 +17,16 @@ class CampSitePipeline(object):
     def open_spider(self, spider):
         # Assigning instance attributes here because this method is called
         # when the spider opens and will always called before process_item.
-        self._conn = txpostgres.Connection()
-        self._db = self._conn.connect(
-            **spider.db_settings
+        self._pool = spider.db_pool or PipelinePool.from_settings(
+            spider.db_settings, spider.settings
         )
+        self._ids = spider.id_cache or IdCache(self._pool.connections)
+        self._db = self._pool.start()
+        self._db.addCallback(lambda _: self._ids.load())
+        return self._db
+
+    def close_spider(self, spider):
+        return self._pool.close()
 
     def process_item(self, item, spider):
         log.info('{} - {}. Campsite pipeline processing.'.format(
@@ -33,8 +40,8 @@ class CampSitePipeline(object):
             item['park_name'], item['site_number'], dict(item)
         ))
 
-        persistor = CampSitePersistor(self._conn, item)
-        d = persistor.save()
+        persistor = CampSitePersistor(self._pool.connections, self._ids, item)
+        d = self._pool.run(persistor.save)
 
         def onerror(err):
             log.error(err)
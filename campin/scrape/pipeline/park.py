@@ -4,7 +4,8 @@ import logging
 import googlemaps
 from psycopg2._json import Json
 from psycopg2.extensions import register_adapter
-from txpostgres import txpostgres
+
+from campin.scrape.pipeline.persistence import PipelinePool
 
 register_adapter(dict, Json)
 log = logging.getLogger(__name__)
@@ -24,12 +25,19 @@ class ParkPipeline(object):
         # Assigning instance attribute here because this method is called
         # when the spider opens and will always called before process_item.
         self._gmaps = googlemaps.Client(spider.gmaps_apikey)
-        self._conn = txpostgres.Connection()
-        self._db = self._conn.connect(**spider.db_settings)
+        self._pool = spider.db_pool or PipelinePool.from_settings(
+            spider.db_settings, spider.settings
+        )
+        self._conn = self._pool.connections
+        self._db = self._pool.start()
+        return self._db
+
+    def close_spider(self, spider):
+        return self._pool.close()
 
     def process_item(self, item, spider):
         log.debug('Processing item: {}'.format(item['park_name']))
-        d = self._update_park(item)
+        d = self._pool.run(self._update_park, item)
 
         return d
 
@@ -1,3 +1,5 @@
 """Classes for saving items to the database."""
+from .cache import IdCache
 from .campsite import CampSitePersistor
-from .reservation import ReservationPersistor
+from .reservation import ReservationWriter
+from .pool import PipelinePool
@@ -0,0 +1,113 @@
+import logging
+
+from twisted.internet import defer
+
+log = logging.getLogger(__name__)
+
+
+class IdCache(object):
+    """
+    In-memory mapping of park names and campsite site numbers to their ids.
+
+    The mappings are loaded once, when the first spider using the cache opens,
+    so pipelines of several crawls can share a cache. Names that are not cached
+    are looked up in the database, and ids of new rows are added with
+    :meth:`set_park_id` and :meth:`set_campsite_id`.
+    """
+
+    def __init__(self, db_connection):
+        """
+        :param db_connection: txpostgres connection or connection pool.
+        """
+        self._conn = db_connection
+        # park_name -> park_id
+        self._park_ids = {}
+        # (park_name, site_number) -> campsite_id
+        self._campsite_ids = {}
+        self._loaded = False
+
+    def load(self):
+        """Load every park and campsite id, unless they are loaded."""
+        if self._loaded:
+            return defer.succeed(self)
+
+        d = self._conn.runQuery(
+            'SELECT park_name, park_id FROM campin.parks'
+        )
+        d.addCallback(self._park_ids.update)
+        d.addCallback(lambda _: self._conn.runQuery(
+            'SELECT park_name, site_number, campsite_id FROM campin.campsites'
+        ))
+        d.addCallback(lambda results: self._campsite_ids.update(
+            ((park_name, site_number), campsite_id)
+            for park_name, site_number, campsite_id in results
+        ))
+
+        def loaded(_):
+            self._loaded = True
+            log.info('Cached {} park ids and {} campsite ids.'.format(
+                len(self._park_ids), len(self._campsite_ids)
+            ))
+            return self
+
+        d.addCallback(loaded)
+        return d
+
+    def cached_campsite_id(self, park_name, site_number):
+        """Return the cached campsite id or None without querying."""
+        return self._campsite_ids.get((park_name, site_number))
+
+    def park_id(self, park_name):
+        """Return a Deferred that fires with the park id or None."""
+        if park_name in self._park_ids:
+            return defer.succeed(self._park_ids[park_name])
+
+        d = self._conn.runQuery(
+            """
+            SELECT park_id
+            FROM campin.parks
+            WHERE park_name = %(park_name)s
+        """, {'park_name': park_name}
+        )
+
+        def parse_results(results):
+            if not results:
+                return None
+            return self.set_park_id(park_name, results[0][0])
+
+        d.addCallback(parse_results)
+        return d
+
+    def campsite_id(self, park_name, site_number):
+        """Return a Deferred that fires with the campsite id or None."""
+        campsite_id = self.cached_campsite_id(park_name, site_number)
+        if campsite_id:
+            return defer.succeed(campsite_id)
+
+        d = self._conn.runQuery(
+            """
+            SELECT campsite_id
+            FROM campin.campsites
+            WHERE park_name = %(park_name)s
+            AND site_number = %(site_number)s
+        """, {'park_name': park_name,
+              'site_number': site_number}
+        )
+
+        def parse_results(results):
+            if not results:
+                return None
+            return self.set_campsite_id(park_name, site_number, results[0][0])
+
+        d.addCallback(parse_results)
+        return d
+
+    def set_park_id(self, park_name, park_id):
+        """Cache the id of a park and return it."""
+        self._park_ids[park_name] = park_id
+        return park_id
+
+    def set_campsite_id(self, park_name, site_number, campsite_id):
+        """Cache the id of a campsite and return it."""
+        self._campsite_ids[(park_name, site_number)] = campsite_id
+        return campsite_id
@@ -8,8 +8,14 @@ log = logging.getLogger(__name__)
 
 class CampSitePersistor(object):
 
-    def __init__(self, db_connection, item):
+    def __init__(self, db_connection, ids, item):
+        """
+        :param db_connection: txpostgres connection or connection pool.
+        :param ids: :class:`IdCache` of park and campsite ids.
+        :param item: :class:`CampSiteItem` to save.
+        """
         self._conn = db_connection
+        self._ids = ids
         self._campsite = item
 
     def save(self):
@@ -39,26 +45,22 @@ class CampSitePersistor(object):
         Set the park id based on the park name in the item. 
         """
         park_name = self._campsite['park_name']
-        d = self._conn.runQuery(
-            """
-            SELECT park_id
-            FROM campin.parks
-            WHERE park_name = %(park_name)s
-        """, {'park_name': park_name}
-        )
+        d = self._ids.park_id(park_name)
 
-        def parse_results(results):
-            if results:
-                self._campsite['park_id'] = results[0][0]
+        def parse_results(park_id):
+            if park_id:
+                self._campsite['park_id'] = park_id
             else:
                 dinsert = self._conn.runQuery("""
                     INSERT INTO campin.parks(park_name)
                     VALUES(%(park_name)s)
                     RETURNING park_id
-                """)
+                """, {'park_name': park_name})
 
                 def set_campsite(insert_results):
-                    self._campsite['park_id'] = insert_results[0][0]
+                    self._campsite['park_id'] = self._ids.set_park_id(
+                        park_name, insert_results[0][0]
+                    )
                 dinsert.addCallback(set_campsite)
                 return dinsert
 
@@ -71,21 +73,13 @@ class CampSitePersistor(object):
         Set the campsite ID if this is an existing campsite based on the
         park name and site number.
         """
-        site_number = self._campsite['site_number']
-        park_name = self._campsite['park_name']
-
-        d = self._conn.runQuery(
-            """
-            SELECT campsite_id
-            FROM campin.campsites
-            WHERE park_name = %(park_name)s
-            AND site_number = %(site_number)s
-        """, {'park_name': park_name,
-              'site_number': site_number}
+        d = self._ids.campsite_id(
+            self._campsite['park_name'],
+            self._campsite['site_number']
         )
 
-        def add_campsite_id(results):
-            self._campsite['campsite_id'] = results[0][0] if results else None
+        def add_campsite_id(campsite_id):
+            self._campsite['campsite_id'] = campsite_id
 
         d.addCallback(add_campsite_id)
         return d
@@ -214,7 +208,11 @@ class CampSitePersistor(object):
         d = self._conn.runQuery(query, dict(self._campsite))
 
         def add_campsite_id(results):
-            self._campsite['campsite_id'] = results[0][0]
+            self._campsite['campsite_id'] = self._ids.set_campsite_id(
+                self._campsite['park_name'],
+                self._campsite['site_number'],
+                results[0][0]
+            )
 
         d.addCallback(add_campsite_id)
         return d
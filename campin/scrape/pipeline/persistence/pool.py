@@ -0,0 +1,82 @@
+import logging
+
+from twisted.internet import defer
+from txpostgres import txpostgres
+
+log = logging.getLogger(__name__)
+
+
+class PipelinePool(object):
+    """
+    Pool of txpostgres connections for a pipeline, with a limit on the items
+    that use it at the same time.
+
+    Items wait for the limit when every connection is busy, which holds back
+    Scrapy's item processing instead of queueing all of its queries on the
+    connections.
+
+    A pool can be shared by the pipelines of several crawls. The connections
+    are made by the first :meth:`start` and closed by the last :meth:`close`.
+    """
+
+    # Number of connections when the size isn't set
+    default_size = 3
+
+    def __init__(self, db_settings, size=default_size):
+        """
+        :param db_settings: Connection arguments from the ``db.*`` settings.
+        :param size: Number of connections.
+        """
+        self.size = size
+        self.connections = txpostgres.ConnectionPool(
+            None, min=self.size, **db_settings
+        )
+        self._limit = defer.DeferredSemaphore(self.size)
+        # Users that started the pool and haven't closed it
+        self._users = 0
+        self._started = None
+
+    @classmethod
+    def from_settings(cls, db_settings, settings):
+        """
+        Return a pool with the number of connections of the ``DB_POOL_SIZE``
+        Scrapy setting.
+        """
+        return cls(
+            db_settings, settings.getint('DB_POOL_SIZE', cls.default_size)
+        )
+
+    def start(self):
+        """
+        Connect every connection of the pool, unless it is started.
+
+        :return: Deferred that fires when the connections are made.
+        """
+        self._users += 1
+        if self._started is None:
+            log.debug('Starting pool of {} connections.'.format(self.size))
+            self._started = self.connections.start()
+
+        d = defer.Deferred()
+
+        def started(result):
+            d.callback(result)
+            return result
+
+        self._started.addBoth(started)
+        return d
+
+    def close(self):
+        """Close the connections once every user closed the pool."""
+        self._users -= 1
+        if self._users > 0:
+            return defer.succeed(None)
+        return self.connections.close()
+
+    def run(self, f, *args, **kwargs):
+        """
+        Call f once fewer items than connections are in progress.
+
+        :return: Deferred that fires with the result of f.
+        """
+        return self._limit.run(f, *args, **kwargs)
@@ -1,148 +1,354 @@
 import logging
-from datetime import date
+import time
+
+from twisted.internet import defer
 
 log = logging.getLogger(__name__)
 
+# Each park page lists every campsite of the park, or of one campground in the
+# park, for a date. Page keys are passed as arrays and joined with unnest,
+# because COPY is not available on the asynchronous connections used by
+# txpostgres.
+_current_query = """
+    SELECT
+      c.park_name,
+      c.site_number,
+      r.reserve_date,
+      r.campsite_id,
+      r.reason
+    FROM unnest(
+      %(park_names)s::varchar[],
+      %(campground_names)s::varchar[],
+      %(reserve_dates)s::date[]
+    ) as p(park_name, campground_name, reserve_date)
+    INNER JOIN campin.campsites c
+      ON c.park_name = p.park_name
+      AND (p.campground_name IS NULL OR c.campground_name = p.campground_name)
+    INNER JOIN campin.reservations r
+      ON r.campsite_id = c.campsite_id
+      AND r.reserve_date = p.reserve_date
+"""
+
+_campsite_ids_query = """
+    SELECT
+      c.park_name,
+      c.site_number,
+      c.campsite_id
+    FROM unnest(
+      %(park_names)s::varchar[],
+      %(site_numbers)s::varchar[]
+    ) as s(park_name, site_number)
+    INNER JOIN campin.campsites c USING (park_name, site_number)
+"""
+
+_delete_query = """
+    DELETE FROM campin.reservations r
+    USING unnest(
+      %(campsite_ids)s::integer[],
+      %(reserve_dates)s::date[]
+    ) as d(campsite_id, reserve_date)
+    WHERE r.campsite_id = d.campsite_id
+    AND r.reserve_date = d.reserve_date
+"""
+
+_update_query = """
+    UPDATE campin.reservations r
+    SET reason = u.reason
+    FROM unnest(
+      %(campsite_ids)s::integer[],
+      %(reserve_dates)s::date[],
+      %(reasons)s::varchar[]
+    ) as u(campsite_id, reserve_date, reason)
+    WHERE r.campsite_id = u.campsite_id
+    AND r.reserve_date = u.reserve_date
+"""
+
+# Another connection may have inserted the reservation since the current rows
+# were read.
+_insert_query = """
+    INSERT INTO campin.reservations(
+      campsite_id,
+      reserve_date,
+      reason
+    )
+    SELECT campsite_id, reserve_date, reason
+    FROM unnest(
+      %(campsite_ids)s::integer[],
+      %(reserve_dates)s::date[],
+      %(reasons)s::varchar[]
+    ) as i(campsite_id, reserve_date, reason)
+    ON CONFLICT (campsite_id, reserve_date) DO UPDATE
+    SET reason = EXCLUDED.reason
+    WHERE reservations.reason IS DISTINCT FROM EXCLUDED.reason
+"""
+
+# Pages of several campgrounds in a park are counted as one scrape of the park.
+_scrapes_query = """
+    INSERT INTO campin.reservation_scrapes AS s(
+      park_name,
+      reserve_date,
+      scrape_count,
+      change_count
+    )
+    SELECT park_name, reserve_date, 1, changed::integer
+    FROM unnest(
+      %(park_names)s::varchar[],
+      %(reserve_dates)s::date[],
+      %(changed)s::boolean[]
+    ) as p(park_name, reserve_date, changed)
+    ON CONFLICT (park_name, reserve_date) DO UPDATE
+    SET scraped_date = current_timestamp,
+      scrape_count = s.scrape_count + 1,
+      change_count = s.change_count + EXCLUDED.change_count
+"""
+
+# Pages are also recorded by campground, so a crawl that stops between the
+# campgrounds of a park resumes with the campgrounds that weren't saved.
+_page_scrapes_query = """
+    INSERT INTO campin.reservation_page_scrapes(
+      park_name,
+      campground_name,
+      reserve_date
+    )
+    SELECT park_name, coalesce(campground_name, ''), reserve_date
+    FROM unnest(
+      %(park_names)s::varchar[],
+      %(campground_names)s::varchar[],
+      %(reserve_dates)s::date[]
+    ) as p(park_name, campground_name, reserve_date)
+    ON CONFLICT (park_name, campground_name, reserve_date) DO UPDATE
+    SET scraped_date = current_timestamp
+"""
 
-class ReservationPersistor(object):
 
-    def __init__(self, db_connection, item):
+class ReservationWriter(object):
+    """
+    Buffer of scraped reservation pages that are saved to the database in
+    batches.
+
+    Each page is a snapshot of the campsites listed for a park and date, so
+    it is compared to the reservations in the database and only the
+    differences are written, in one transaction per batch.
+    """
+
+    def __init__(self, db_connection, ids, batch_size=1000):
+        """
+        :param db_connection: txpostgres connection or connection pool.
+        :param ids: :class:`IdCache` of campsite ids.
+        :param batch_size: Number of buffered reservations that triggers a
+            flush.
+        """
         self._conn = db_connection
-        self._reservation = item
+        self._ids = ids
+        self._batch_size = batch_size
+        # (park_name, campground_name, reserve_date) -> {site_number: reason}
+        self._pending = {}
+        self._pending_count = 0
+        # Pages saved and the seconds taken by the flushes that saved them
+        self.flushed_pages = 0
+        self.flush_seconds = 0.0
+
+    def add(self, page):
+        """
+        Buffer a :class:`ReservationPageItem`.
+
+        :return: Deferred that fires after the buffer is flushed if it is
+            full, otherwise a Deferred that has already fired.
+        """
+        key = (
+            page['park_name'],
+            page['campground_name'],
+            page['reserve_date'].date()
+        )
+        # A later scrape of the same page replaces the earlier one.
+        sites = dict(page['sites'])
+        self._pending_count += len(sites) - len(self._pending.get(key, ()))
+        self._pending[key] = sites
+
+        if self._pending_count >= self._batch_size:
+            return self.flush()
+        return defer.succeed(None)
+
+    def flush(self):
+        """
+        Save the differences between the buffered pages and the database.
+
+        Pages of a flush that fails are put back in the buffer, unless the
+        same page was buffered again since, and saved by the next flush.
+
+        :return: Deferred that fires with the number of reservations changed.
+        """
+        if not self._pending:
+            return defer.succeed(0)
+
+        pending, self._pending = self._pending, {}
+        self._pending_count = 0
+        log.debug('Saving {} reservation pages.'.format(len(pending)))
+
+        def restore(failure):
+            for key, sites in pending.items():
+                if key not in self._pending:
+                    self._pending[key] = sites
+                    self._pending_count += len(sites)
+            return failure
+
+        started = time.perf_counter()
 
-    def save(self):
-        d = self._get_campsite()
+        def saved(changed):
+            self.flush_seconds += time.perf_counter() - started
+            self.flushed_pages += len(pending)
+            return changed
 
-        def campsite_callback(campsite_id):
+        d = self._conn.runInteraction(_PageDiff(self._ids, pending).apply)
+        d.addCallbacks(saved, restore)
+        return d
+
+
+class _PageDiff(object):
+    """Differences between scraped pages and the reservations in a transaction."""
+
+    def __init__(self, ids, pages):
+        """
+        :param ids: :class:`IdCache` of campsite ids.
+        :param pages: Dictionary of (park_name, campground_name, reserve_date)
+            to a dictionary of site number to reason.
+        """
+        self._ids = ids
+        self._pages = pages
+        # (park_name, site_number, reserve_date) -> reason
+        self._scraped = {
+            (park_name, site_number, reserve_date): reason
+            for (park_name, _, reserve_date), sites in pages.items()
+            for site_number, reason in sites.items()
+        }
+        # (park_name, site_number, reserve_date) -> (campsite_id, reason)
+        self._current = {}
+        self._deletes = []
+        self._updates = []
+        self._inserts = []
+        # (park_name, reserve_date) of pages with changed reservations
+        self._changed = set()
+
+    def apply(self, cursor):
+        """Write the differences using the cursor of a transaction."""
+        park_names, campground_names, reserve_dates = zip(*self._pages.keys())
+        d = cursor.execute(_current_query, {
+            'park_names': list(park_names),
+            'campground_names': list(campground_names),
+            'reserve_dates': list(reserve_dates),
+        })
+        d.addCallback(lambda cursor: self._compare(cursor, cursor.fetchall()))
+        d.addCallback(self._set_campsite_ids)
+        d.addCallback(self._write)
+        return d
+
+    def _compare(self, cursor, current):
+        """
+        Find reservations that were removed or changed, and the new
+        reservations that need a campsite id.
+        """
+        for park_name, site_number, reserve_date, campsite_id, reason in current:
+            key = (park_name, site_number, reserve_date)
+            self._current[key] = (campsite_id, reason)
+
+            scraped_reason = self._scraped.get(key)
+            if scraped_reason is None or scraped_reason == 'Available':
+                # Available or no longer listed on the page
+                self._deletes.append((campsite_id, reserve_date))
+                self._changed.add((park_name, reserve_date))
+            elif scraped_reason != reason:
+                self._updates.append((campsite_id, reserve_date, scraped_reason))
+                self._changed.add((park_name, reserve_date))
+
+        # Campsites of new reservations that are not in the id cache
+        missing = {
+            (park_name, site_number)
+            for (park_name, site_number, reserve_date), reason
+            in self._scraped.items()
+            if reason != 'Available' and
+            (park_name, site_number, reserve_date) not in self._current and
+            not self._ids.cached_campsite_id(park_name, site_number)
+        }
+        if not missing:
+            return cursor
+
+        park_names, site_numbers = zip(*missing)
+        d = cursor.execute(_campsite_ids_query, {
+            'park_names': list(park_names),
+            'site_numbers': list(site_numbers),
+        })
+
+        def cache_ids(cursor):
+            for park_name, site_number, campsite_id in cursor.fetchall():
+                self._ids.set_campsite_id(park_name, site_number, campsite_id)
+            return cursor
+
+        d.addCallback(cache_ids)
+        return d
+
+    def _set_campsite_ids(self, cursor):
+        for key, reason in self._scraped.items():
+            if reason == 'Available' or key in self._current:
+                continue
+            park_name, site_number, reserve_date = key
+            campsite_id = self._ids.cached_campsite_id(park_name, site_number)
             if not campsite_id:
                 log.info('{} - {}. Campsite not found.'.format(
-                    self._reservation['park_name'],
-                    self._reservation['site_number']
+                    park_name, site_number
                 ))
-                return
-            log.info('{} - {}. Found campsite.'.format(
-                    self._reservation['park_name'],
-                    self._reservation['site_number']
-            ))
-            d = self._reservation_exists()
-            d.addCallback(self._insert_or_update)
-            d.addCallback(lambda _: self._reservation)
-            return d
-
-        d.addCallback(campsite_callback)
-        return d
+                continue
+            self._inserts.append((campsite_id, reserve_date, reason))
+            self._changed.add((park_name, reserve_date))
+        return cursor
 
-    def _get_campsite(self):
-        log.debug('Searching for campsite. Park name: {}. Site number: {}'.format(
-            self._reservation['park_name'],
-            self._reservation['site_number']
-        ))
-        d = self._conn.runQuery(
-            """
-            SELECT campsite_id
-            FROM campin.campsites
-            WHERE park_name = %(park_name)s
-            AND site_number = %(site_number)s
-        """, {'park_name': self._reservation['park_name'],
-              'site_number': self._reservation['site_number']}
+    def _write(self, cursor):
+        log.debug(
+            'Reservation changes. Deleted: {}. Updated: {}. Inserted: {}.'.format(
+                len(self._deletes), len(self._updates), len(self._inserts)
+            )
+        )
+        d = defer.succeed(cursor)
+        for query, rows in (
+            (_delete_query, self._deletes),
+            (_update_query, self._updates),
+            (_insert_query, self._inserts),
+        ):
+            if rows:
+                d.addCallback(_execute_rows, query, rows)
+        d.addCallback(self._record_scrapes)
+        d.addCallback(
+            lambda _: len(self._deletes) + len(self._updates) + len(self._inserts)
         )
+        return d
 
-        def add_campsite_id(results):
-            campsite_id = results[0][0] if results else None
-            self._reservation['campsite_id'] = campsite_id
-            return campsite_id
+    def _record_scrapes(self, cursor):
+        scraped = list({
+            (park_name, reserve_date)
+            for park_name, _, reserve_date in self._pages.keys()
+        })
+        park_names, reserve_dates = zip(*scraped)
+        d = cursor.execute(_scrapes_query, {
+            'park_names': list(park_names),
+            'reserve_dates': list(reserve_dates),
+            'changed': [key in self._changed for key in scraped],
+        })
 
-        d.addCallback(add_campsite_id)
+        park_names, campground_names, reserve_dates = zip(*self._pages.keys())
+        d.addCallback(lambda cursor: cursor.execute(_page_scrapes_query, {
+            'park_names': list(park_names),
+            'campground_names': list(campground_names),
+            'reserve_dates': list(reserve_dates),
+        }))
         return d
 
-    def _reservation_exists(self):
-        reserve_date = self._reservation['reserve_date'].date()
-
-        log.debug('Searching for reservation. Campsite ID: {}. Date: {}'.format(
-            self._reservation['campsite_id'],
-            reserve_date
-        ))
-        d_reservation_id = self._conn.runQuery(
-            """
-            SELECT reservation_id
-            FROM reservations
-            WHERE campsite_id = %(campsite_id)s
-            AND reserve_date = %(reserve_date)s
-        """, {
-                'campsite_id': self._reservation['campsite_id'],
-                'reserve_date': reserve_date
-            }
-        )
 
-        d_reservation_id.addCallback(lambda result: result[0][0] if result else None)
-        return d_reservation_id
-
-    def _insert_or_update(self, reservation_id):
-
-        if reservation_id:
-            sql = self._update_reservation_sql()
-        else:
-            sql = self._insert_reservation_sql()
-
-        if not sql:
-            # If site is available there will be no row to insert
-            return
-
-        params = dict(self._reservation)
-        params['campsite_id'] = self._reservation['campsite_id']
-        params['reservation_id'] = reservation_id
-        d_update = self._conn.runOperation(sql, params)
-        return d_update
-
-    def _update_reservation_sql(self):
-        if self._reservation['reason'] == 'Available':
-            log.debug((
-                          'Removing reservation that is now available. ' +
-                          'Park name: {park_name}. ' +
-                          'Site number: {site_number}'
-                      ).format(**dict(self._reservation)))
-            query = """
-                    DELETE FROM campin.reservations
-                    WHERE reservation_id = %(reservation_id)s
-                """
-        else:
-            log.debug((
-                          'Updating existing reservation. ' +
-                          'Park name: {park_name}. ' +
-                          'Site number: {site_number}. ' +
-                          'Status: {reason}'
-                      ).format(**dict(self._reservation)))
-            query = """
-                    UPDATE campin.reservations
-                    SET reason = %(reason)s 
-                    WHERE reservation_id = %(reservation_id)s
-                """
-        return query
-
-    def _insert_reservation_sql(self):
-        if self._reservation['reason'] == 'Available':
-            log.debug((
-                          'Not inserting reservation for available date. ' +
-                          'Park name: {park_name}. ' +
-                          'Site number: {site_number}. ' +
-                          'Status: {reason}'
-                      ).format(**dict(self._reservation)))
-            return
-
-        log.debug((
-                      'Inserting new reservation. ' +
-                      'Park name: {park_name}. ' +
-                      'Site number: {site_number}. ' + 'Status: {reason}'
-                  ).format(**dict(self._reservation)))
-        query = """
-            INSERT INTO campin.reservations(
-              campsite_id,
-              reserve_date,
-              reason
-            )VALUES(
-              %(campsite_id)s,
-              %(reserve_date)s,
-              %(reason)s
-            )
-        """
-        return query
+def _execute_rows(cursor, query, rows):
+    """Execute query with each column of rows passed as an array parameter."""
+    columns = list(zip(*rows))
+    params = {
+        'campsite_ids': list(columns[0]),
+        'reserve_dates': list(columns[1]),
+    }
+    if len(columns) > 2:
+        params['reasons'] = list(columns[2])
+    return cursor.execute(query, params)
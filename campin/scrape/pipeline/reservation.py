@@ -3,9 +3,11 @@ import logging
 
 from psycopg2._json import Json
 from psycopg2.extensions import register_adapter
-from txpostgres import txpostgres
+from twisted.internet import defer, task
 
-from campin.scrape.pipeline.persistence.reservation import ReservationPersistor
+from campin.scrape.pipeline.persistence import (
+    IdCache, PipelinePool, ReservationWriter
+)
 
 log = logging.getLogger(__name__)
 
@@ -16,24 +18,124 @@ class ReservationPipeline(object):
         # Assigning instance attribute here because this method is called
         # when the spider opens and will always called before process_item.
         register_adapter(dict, Json)
-        self._conn = txpostgres.Connection()
-        self._db = self._conn.connect(**spider.db_settings)
+        self._stats = spider.crawler.stats
+        self._pool = spider.db_pool or PipelinePool.from_settings(
+            spider.db_settings, spider.settings
+        )
+        self._ids = spider.id_cache or IdCache(self._pool.connections)
+        self._db = self._pool.start()
+        self._db.addCallback(lambda _: self._ids.load())
+
+        # Reservation pages are buffered and saved when the batch is full or
+        # the flush interval passes.
+        self._writer = ReservationWriter(
+            self._pool.connections,
+            self._ids,
+            spider.settings.getint('RESERVATION_BATCH_SIZE', 1000)
+        )
+        # Flushes run one at a time, so the last flush waits for a flush of
+        # the loop that is still saving.
+        self._flush_lock = defer.DeferredLock()
+        self._flush_loop = task.LoopingCall(self._flush_buffered)
+        self._flush_loop.start(
+            spider.settings.getfloat('RESERVATION_FLUSH_INTERVAL', 5),
+            now=False
+        )
+
+        # The data generation is incremented at most once per interval while
+        # reservations are being saved, so the API's cached responses expire.
+        self._changed = False
+        self._generation_loop = task.LoopingCall(self._bump_generation)
+        self._generation_loop.start(
+            spider.settings.getfloat('DATA_GENERATION_INTERVAL', 60),
+            now=False
+        )
+
+        return self._db
+
+    def close_spider(self, spider):
+        self._flush_loop.stop()
+        self._generation_loop.stop()
+        d = self._flush()
+        d.addBoth(self._close)
+        return d
+
+    def _close(self, flushed):
+        """
+        Close the pool after the last flush. A failure of the last flush is
+        returned, so the pages that weren't saved are reported.
+        """
+        self._stats.set_value(
+            'reservations/flushed_pages', self._writer.flushed_pages
+        )
+        self._stats.set_value(
+            'reservations/flush_seconds', self._writer.flush_seconds
+        )
+        d = defer.maybeDeferred(self._bump_generation)
+        d.addBoth(lambda _: self._pool.close())
+        d.addCallback(lambda _: flushed)
+        return d
 
     def process_item(self, item, spider):
-        log.debug('Processing reservation: {}'.format(dict(item)))
         log.info(
-            '{} - {}. Processing reservation.'.format(
-                item['park_name'], item['site_number']
+            '{} - {} - {}. Processing reservation page. Sites: {}.'.format(
+                item['reserve_date'],
+                item['park_name'],
+                item['campground_name'],
+                len(item['sites'])
             )
         )
 
-        persistor = ReservationPersistor(self._conn, item)
-        d = persistor.save()
+        # Pages wait here while every connection is saving a batch.
+        d = self._pool.run(self._writer.add, item)
+
+        def onsaved(saved):
+            if saved:
+                self._changed = True
+            return item
 
         def onerror(err):
             log.error(err)
             return err
 
+        d.addCallbacks(onsaved, onerror)
+
+        return d
+
+    def _flush(self):
+        """Save buffered reservations after any flush in progress."""
+        d = self._flush_lock.run(self._pool.run, self._writer.flush)
+
+        def onsaved(saved):
+            if saved:
+                log.info('Changed {} reservations.'.format(saved))
+                self._changed = True
+
+        d.addCallback(onsaved)
+        return d
+
+    def _flush_buffered(self):
+        """
+        Save buffered reservations every flush interval. Pages of a flush
+        that fails stay buffered and are saved by the next flush.
+        """
+        d = self._flush()
+
+        def onerror(err):
+            log.error('Could not save reservations, retrying at the next '
+                      'flush. {}'.format(err))
+
         d.addErrback(onerror)
+        return d
 
+    def _bump_generation(self):
+        """Increment the data generation if reservations were saved."""
+        if not self._changed:
+            return
+        self._changed = False
+        log.debug('Incrementing data generation.')
+        d = self._pool.connections.runOperation(
+            'UPDATE campin.data_generation SET generation = generation + 1'
+        )
+        d.addErrback(log.error)
         return d
@@ -3,14 +3,16 @@ import logging
 from datetime import datetime, timedelta
 
 import scrapy
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
 
-from campin.scrape.items import ReservationItem
-from campin.scrape.util import text
+from campin.scrape import pages, sitetable
+from campin.scrape.form import FormTemplate
+from campin.scrape.items import ReservationPageItem, ReservationRows
+from campin.scrape.pages import ParsePool
 
 log = logging.getLogger(__name__)
 
-_status_map = {'Reserve!': 'Available'}
-
 
 class ReservationSpider(scrapy.Spider):
 
@@ -18,161 +20,428 @@ class ReservationSpider(scrapy.Spider):
     start_urls = ['https://reservations.ontarioparks.com/Algonquin-Achray?List']
     park_post_url = 'https://reservations.OntarioParks.com/Viewer.aspx'
 
-    def __init__(self, db_settings):
+    def __init__(self, db_settings, nights=1, scheduler=None, budget=None,
+                 completed=None, work_queue=None, today=None, db_pool=None,
+                 id_cache=None, reserved=None):
+        """
+        :param db_settings: Database connection settings for the pipeline.
+        :param nights: Most nights in each search. Searches for more than one
+            night cover several dates with one request. When every listed site
+            is free for the whole stay the page is saved for each night,
+            otherwise the stay is split in two and each half is searched.
+        :param scheduler: :class:`RefreshScheduler` that chooses the park and
+            date searches to make, instead of searching every park for every
+            date. Searches are for one night.
+        :param budget: Number of searches chosen by the scheduler.
+        :param completed: Set of park name and date that were scraped
+            recently and are skipped.
+        :param work_queue: :class:`WorkQueue` of the sweep that this spider
+            shares with other workers. The searches are added to the queue and
+            the spider makes the searches it claims.
+        :param today: Datetime the searches start from, to replay a recorded
+            crawl. Defaults to now.
+        :param db_pool: :class:`PipelinePool` shared with other crawls. The
+            pipeline makes its own when None.
+        :param id_cache: :class:`IdCache` shared with other crawls. The
+            pipeline makes its own when None.
+        :param reserved: Set of park name and date that had reserved
+            campsites when last scraped. Those nights are searched one at a
+            time, since a stay that includes them would be split anyway.
+        """
         super().__init__()
         self.db_settings = db_settings
-        current_year = datetime.now().year
+        self.db_pool = db_pool
+        self.id_cache = id_cache
+        self._nights = max(int(nights), 1)
+        self._scheduler = scheduler
+        self._budget = budget
+        self._completed = completed or set()
+        self._reserved = reserved or set()
+        self._work_queue = work_queue
+        self._work_filled = None
+        self._work_claiming = False
+        self._work_done = False
+        self._today = today or datetime.now()
+        current_year = self._today.year
         # Only the summer months
         start_date = max(
             datetime(current_year, 5, 19),
-            datetime.now()
+            self._today
         )
-        end_date = datetime(current_year, 10, 31)
-        date_diff = end_date - start_date
+        self._end_date = datetime(current_year, 10, 31)
+        date_diff = self._end_date - start_date
         days = int(date_diff.total_seconds() / 86400)
         log.debug(
-            'Starting at: {}. Days: {}'.format(start_date.isoformat(), days)
-        )
-        # Generate a datetime for every day
-        self._dates = (
-            start_date + timedelta(days=i) for i in range(0, days + 1)
+            'Starting at: {}. Days: {}. Nights: {}.'.format(
+                start_date.isoformat(), days, self._nights
+            )
         )
+        self._days = [start_date + timedelta(days=i) for i in range(days + 1)]
+        self._form = None
+        self._parse_pool = ParsePool()
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider._parse_pool = ParsePool.from_crawler(crawler)
+        if spider._work_queue:
+            crawler.signals.connect(
+                lambda spider: spider._work_queue.open(),
+                signals.spider_opened,
+                weak=False
+            )
+            crawler.signals.connect(
+                lambda spider: spider._work_queue.close(),
+                signals.spider_closed,
+                weak=False
+            )
+            crawler.signals.connect(spider._claim_work, signals.spider_idle)
+        return spider
 
     def parse(self, response):
         """
         Initiate a request for each park.
         """
-        for reserve_date in self._dates:
-            nights = '1'
-            # Form requires both a date that is the first of the month
-            # and the date you are looking for a reservation
-            month_str = reserve_date.strftime(
-                '%a %b 01 %Y 00:00:00 GMT-0400 (EDT)'
-            )
-            date_str = reserve_date.strftime(
-                '%a %b %d %Y 00:00:00 GMT-0400 (EDT)'
-            )
-            self.logger.debug('Date: {}'.format(date_str))
+        # Every search submits the same form
+        self._form = FormTemplate.from_response(
+            response,
+            formname='MainForm',
+            dont_click=True
+        )
+
+        # Each park in the reserve form
+        parks = []
+        for park_option in response.css(
+                'select[name="ctl00$MainContentPlaceHolder$LocationList"] option'
+        ):
+            park_name = park_option.xpath('text()').extract()[0]
+            park_id = park_option.xpath('@value').extract()[0]
+
+            if park_name == 'Ontario Parks':
+                continue
+            parks.append((park_id, park_name))
+
+        if self._scheduler:
+            searches = self._scheduled_searches(parks)
+        else:
+            searches = self._sweep_searches(parks)
 
-            # Each park in the reserve form
-            for park_option in response.css(
-                    'select[name="ctl00$MainContentPlaceHolder$LocationList"] option'
-            ):
-                park_name = park_option.xpath('text()').extract()[0]
-                park_id = park_option.xpath('@value').extract()[0]
+        if self._work_queue:
+            # Workers make the searches they claim from the queue when the
+            # spider is idle.
+            self._work_filled = self._work_queue.fill(searches)
+            return
+
+        for park_id, park_name, reserve_date, nights, priority in searches:
+            log.debug('Date: {}. Park: {}. Making request.'.format(
+                reserve_date,
+                park_name
+            ))
+            yield self._park_request(
+                park_id,
+                reserve_date,
+                nights,
+                priority=priority
+            )
 
-                if park_name == 'Ontario Parks':
+    def _sweep_searches(self, parks):
+        """
+        Return a list of park id, park name, date, nights and priority for
+        each park and stay that wasn't scraped recently.
+        """
+        searches = []
+        for park_id, park_name in parks:
+            for reserve_date, nights in self._stays(park_name):
+                if self._is_completed(park_name, reserve_date, nights):
+                    log.debug('Date: {}. Park: {}. Already scraped.'.format(
+                        reserve_date,
+                        park_name
+                    ))
                     continue
+                searches.append((park_id, park_name, reserve_date, nights, 0))
+        # Every park is searched for a date before the next date
+        searches.sort(key=lambda search: search[2])
+        return searches
+
+    def _stays(self, park_name):
+        """
+        Return a list of first date and nights of the stays that cover the
+        season for a park.
+
+        Stays are up to the spider's nights long. Nights that had reserved
+        campsites are stays of their own.
+        """
+        # Pages are saved with the park name without its parent park
+        park_name = park_name.split(' - ')[-1]
+        stays = []
+        extend = False
+        for day in self._days:
+            reserved = (park_name, day.date()) in self._reserved
+            if extend and not reserved:
+                reserve_date, nights = stays[-1]
+                stays[-1] = (reserve_date, nights + 1)
+            else:
+                stays.append((day, 1))
+            extend = not reserved and stays[-1][1] < self._nights
+        return stays
+
+    def _is_completed(self, park_name, reserve_date, nights=1):
+        """Return True if every night of the stay was scraped recently."""
+        # Pages are saved with the park name without its parent park
+        park_name = park_name.split(' - ')[-1]
+        return all(
+            (park_name, (reserve_date + timedelta(days=i)).date())
+            in self._completed
+            for i in range(nights)
+        )
+
+    def _scheduled_searches(self, parks):
+        """
+        Return the one night searches chosen by the scheduler, with a priority
+        so the most valuable searches are made first.
+        """
+        searches = [
+            # Pages are saved with the park name without its parent park
+            (park_name.split(' - ')[-1], reserve_date, park_id, park_name)
+            for reserve_date in self._days
+            for park_id, park_name in parks
+            if not self._is_completed(park_name, reserve_date)
+        ]
+        budget = self._budget or len(searches)
+        chosen = self._scheduler.select(searches, budget, self._today)
+        log.info('Scheduled {} of {} searches.'.format(
+            len(chosen), len(searches)
+        ))
+
+        return [
+            (park_id, park_name, reserve_date, 1, len(chosen) - rank)
+            for rank, (_, reserve_date, park_id, park_name) in enumerate(chosen)
+        ]
+
+    def _claim_work(self, spider):
+        """
+        Make the next searches claimed from the work queue when the spider is
+        idle, and keep the spider open until the queue is empty.
+        """
+        if self._work_filled is None or self._work_done:
+            # The start page wasn't parsed, or there's nothing left to claim.
+            return
+        if not self._work_claiming:
+            self._work_claiming = True
+            d = self._work_filled
+            d.addCallback(lambda _: self._work_queue.claim())
+            d.addCallback(self._schedule_work)
+            d.addErrback(log.error)
+
+            def claimed(_):
+                self._work_claiming = False
+
+            d.addBoth(claimed)
+        raise DontCloseSpider()
 
-                form_params = {
-                    'ctl00$MainContentPlaceHolder$LocationList': park_id,
-                    'selArrMth': month_str,
-                    'selArrDay': date_str,
-                    'txtArrDateHidden': reserve_date.strftime('%Y-%m-%d'),
-                    'selNumNights': nights,
-                    'selEquipmentSub': 'Single Tent/Shelter',
-                    'selPartySize': '1'
-                }
-
-                # Form requires some cookies to be set before submitting
-                cookies = {
-                    'ArrivalDate': reserve_date.strftime('%Y-%m-%d'),
-                    'NumberOfNights': nights
-                }
-                log.debug('Date: {}. Park: {}. Making request.'.format(
+    def _schedule_work(self, searches):
+        log.info('Sweep {}. Claimed {} searches.'.format(
+            self._work_queue.sweep_id, len(searches)
+        ))
+        if not searches:
+            self._work_done = True
+            return
+        for park_id, reserve_date, nights, priority in searches:
+            self.crawler.engine.crawl(
+                self._park_request(
+                    park_id,
                     reserve_date,
-                    park_name
-                ))
-                request = scrapy.FormRequest.from_response(
-                    response,
-                    formname='MainForm',
-                    formdata=form_params,
-                    dont_click=True,
-                    callback=self._park_callback,
-                    cookies=cookies,
-                    meta={'reserve_date': reserve_date},
-                    dont_filter=True
-                )
-                request.meta['reserve_date'] = reserve_date
-                yield request
+                    nights,
+                    priority=priority
+                ),
+                self
+            )
+
+    def _park_request(self, park_id, reserve_date, nights, area=None,
+                      priority=0):
+        """
+        Return a request that searches a park for a stay.
+
+        :param park_id: Value of the park in the form's location list.
+        :param reserve_date: Date of the first night.
+        :param nights: Number of nights in the stay.
+        :param area: Link text and href of the only campground area to
+            follow when the park asks for an area to be chosen.
+        :param priority: Scrapy priority of the request.
+        """
+        nights_str = str(nights)
+        # Form requires both a date that is the first of the month
+        # and the date you are looking for a reservation
+        month_str = reserve_date.strftime(
+            '%a %b 01 %Y 00:00:00 GMT-0400 (EDT)'
+        )
+        date_str = reserve_date.strftime(
+            '%a %b %d %Y 00:00:00 GMT-0400 (EDT)'
+        )
+        self.logger.debug('Date: {}. Nights: {}'.format(date_str, nights_str))
+
+        form_params = {
+            'ctl00$MainContentPlaceHolder$LocationList': park_id,
+            'selArrMth': month_str,
+            'selArrDay': date_str,
+            'txtArrDateHidden': reserve_date.strftime('%Y-%m-%d'),
+            'selNumNights': nights_str,
+            'selEquipmentSub': 'Single Tent/Shelter',
+            'selPartySize': '1'
+        }
+
+        # Form requires some cookies to be set before submitting
+        cookies = {
+            'ArrivalDate': reserve_date.strftime('%Y-%m-%d'),
+            'NumberOfNights': nights_str
+        }
+        return self._form.request(
+            form_params,
+            callback=self._park_callback,
+            cookies=cookies,
+            meta={
+                'park_id': park_id,
+                'reserve_date': reserve_date,
+                'nights': nights,
+                'area': area,
+            },
+            # Search bodies include the page's view state, so the same search
+            # made with another landing page looks like a different request.
+            dont_filter=True,
+            priority=priority
+        )
 
     def _park_callback(self, response):
         """
-        Generate :class:`CampSiteItem` and :class:`ReservationItem` for the park
-        that we are scraping
+        Return a Deferred that fires with a list of
+        :class:`ReservationPageItem` with the campsites listed on the park
+        page that we are scraping, or of requests for more pages.
+
+        The page is parsed by the spider's :class:`ParsePool`.
         """
+        d = self._parse_pool.run(
+            pages.park_page, response, sitetable.reservation_rows
+        )
+        d.addCallback(lambda page: list(self._park_results(response, page)))
+        return d
+
+    def _park_results(self, response, page):
         parent_name, park_name, campground_name = self._park_names_selected(
-            response
+            page
         )
         reserve_date = response.meta['reserve_date']
+        nights = response.meta.get('nights', 1)
 
-        log.debug('Date: {}. Park: {}. Park page responsed.'.format(
-            reserve_date, park_name
+        log.debug('Date: {}. Nights: {}. Park: {}. Park page responsed.'.format(
+            reserve_date, nights, park_name
         ))
 
-        if response.css('#viewAvailabilityMsg'):
+        if page.area_links is not None:
             # A campground area must be chosen with a new request
-            area_table = response.css('.list_new')
-            for anchor in area_table.css('a::attr("href")'):
-                url = response.urljoin(anchor.extract())
+            only_area = response.meta.get('area')
+            followed = False
+            for area_name, href in page.area_links:
+                if only_area and area_name != only_area[0] and \
+                        href != only_area[1]:
+                    continue
+                followed = True
+                url = response.urljoin(href)
 
-                request = scrapy.Request(url, callback=self._park_callback)
+                request = scrapy.Request(
+                    url,
+                    callback=self._park_callback,
+                    priority=response.request.priority
+                )
+                request.meta['park_id'] = response.meta.get('park_id')
                 request.meta['reserve_date'] = reserve_date
+                request.meta['nights'] = nights
+                # A split of the stay follows the same area
+                request.meta['area'] = (area_name, href)
                 yield request
+            if only_area and not followed:
+                log.warning(
+                    'Date: {}. Nights: {}. Park: {}. Area {} not found, the '
+                    'stay is not scraped.'.format(
+                        reserve_date, nights, park_name, only_area[0]
+                    )
+                )
+                self.crawler.stats.inc_value('reservations/missing_areas')
             # Nothing else to do in this function, because it's not a real park page
             # parks will be parsed with requests in the above loop
             return
 
-        site_table = response.css('.list_new')
-        for row in site_table.css('tbody tr'):
-            cells = list(row.css('td'))
-            if not cells:
-                # header row
-                continue
+        if page.rows is None:
+            # Without the table we don't know which sites are listed, and an
+            # empty page would remove every reservation for the date.
+            log.warning('Date: {}. Park: {}. No campsite table found.'.format(
+                reserve_date, park_name
+            ))
+            return
 
-            site_number = cells[1].css('a::text').extract()[0].split()[0].strip()
-            log.debug('Date: {}. Site number: {}'.format(reserve_date, site_number))
+        sites = ReservationRows(page.rows)
+        log.debug('Date: {}. Park: {}. Sites: {}.'.format(
+            reserve_date, park_name, len(sites)
+        ))
 
-            # Status of campsite reservation for the date
-            site_status = cells[3].css('a::text')
-            if not site_status:
-                site_status = cells[3].xpath('text()')
+        if nights == 1:
+            yield self._page(park_name, campground_name, reserve_date, sites)
+            return
 
-            site_status = site_status.extract()[0]
-            log.debug('{} - {} - {}. Scraping site reservation.'.format(
-                reserve_date,
-                park_name,
-                site_number
-            ))
+        if sites.reasons == ['Available']:
+            # Every site is free for every night of the stay
+            for i in range(nights):
+                yield self._page(
+                    park_name,
+                    campground_name,
+                    reserve_date + timedelta(days=i),
+                    sites
+                )
+            return
 
-            res = ReservationItem()
-            res['reason'] = _status_map.get(site_status, site_status)
-            res['reserve_date'] = reserve_date
-            res['park_name'] = park_name
-            res['site_number'] = site_number
+        # The page doesn't say which nights of the stay are reserved, so
+        # each half of the stay is searched until the stays are one night.
+        log.debug('Date: {}. Nights: {}. Park: {}. Splitting the stay.'.format(
+            reserve_date, nights, park_name
+        ))
+        park_id = response.meta.get('park_id')
+        if park_id is None:
+            return
+        first_nights = nights // 2
+        for start, stay_nights in (
+                (reserve_date, first_nights),
+                (reserve_date + timedelta(days=first_nights),
+                 nights - first_nights)
+        ):
+            yield self._park_request(
+                park_id,
+                start,
+                stay_nights,
+                response.meta.get('area'),
+                response.request.priority
+            )
 
-            yield res
+    def _page(self, park_name, campground_name, reserve_date, sites):
+        """Return a :class:`ReservationPageItem` of sites for one date."""
+        page = ReservationPageItem()
+        page['park_name'] = park_name
+        page['campground_name'] = campground_name
+        page['reserve_date'] = reserve_date
+        # Pages for the nights of a stay share the rows
+        page['sites'] = sites
+        return page
 
-    def _park_names_selected(self, response):
+    def _park_names_selected(self, page):
         """
         Find the park name, campground name, and parent park name from
-        the form selection.
+        the form selection of a :class:`ParkPage`.
         """
         parent_park_name = None
-        park_name = text(
-            response.css(
-                'select[name="ctl00$MainContentPlaceHolder$LocationList"] > option[selected]'
-            )
-        )
+        park_name = page.location_name
 
         if ' - ' in park_name:
             parent_park_name, park_name = park_name.split(' - ')
 
-        campground_name = text(
-            response.css(
-                'select[name="ctl00$MainContentPlaceHolder$MapList"] > option[selected]'
-            )
-        )
+        campground_name = page.campground_name
 
         if campground_name == 'All Campgrounds':
             campground_name = None
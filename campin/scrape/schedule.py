@@ -0,0 +1,137 @@
+"""Priorities for re-scraping reservation pages."""
+import logging
+
+log = logging.getLogger(__name__)
+
+_stats_query = """
+    SELECT
+      park_name,
+      reserve_date,
+      extract(epoch from current_timestamp - scraped_date) / 3600,
+      scrape_count,
+      change_count
+    FROM campin.reservation_scrapes
+    WHERE reserve_date >= current_date
+"""
+
+
+class RefreshScheduler(object):
+    """
+    Chooses which park and date searches to make when only a limited number
+    of requests can be made.
+
+    A search is worth more the sooner its date is, the more often scraping
+    it has changed reservations before, and the longer it has been since it
+    was last scraped.
+    """
+
+    def __init__(self, stats, horizon_days=14, max_hours=24 * 7):
+        """
+        :param stats: Dictionary of (park_name, reserve_date) to hours since
+            last scraped, number of scrapes and number of scrapes that
+            changed reservations.
+        :param horizon_days: Dates this many days away are worth half as
+            much as today.
+        :param max_hours: Hours since last scraped after which a search
+            isn't worth more. Searches that were never scraped have this age.
+        """
+        self._stats = stats
+        self._horizon_days = horizon_days
+        self._max_hours = max_hours
+
+    @classmethod
+    def load(cls, cursor, **kwargs):
+        """Return a scheduler with the scrape history from the database."""
+        cursor.execute(_stats_query)
+        stats = {
+            (park_name, reserve_date): (float(hours), scrapes, changes)
+            for park_name, reserve_date, hours, scrapes, changes
+            in cursor.fetchall()
+        }
+        log.info('Loaded scrape history of {} park dates.'.format(len(stats)))
+        return cls(stats, **kwargs)
+
+    def priority(self, park_name, reserve_date, today):
+        """
+        Return the expected value of searching a park for a date.
+
+        :param park_name: Name of the park.
+        :param reserve_date: Datetime searched for.
+        :param today: Datetime of the crawl.
+        """
+        hours, scrapes, changes = self._stats.get(
+            (park_name, reserve_date.date()),
+            (self._max_hours, 0, 0)
+        )
+        # Share of scrapes that changed reservations. Smoothed so dates with
+        # little history are still scraped.
+        change_rate = (changes + 1) / (scrapes + 2)
+        staleness = min(hours, self._max_hours) / self._max_hours
+        days_away = max((reserve_date - today).days, 0)
+        urgency = self._horizon_days / (self._horizon_days + days_away)
+        return urgency * change_rate * staleness
+
+    def select(self, searches, budget, today):
+        """
+        Return the searches worth the most, highest first.
+
+        :param searches: Iterable of tuples that start with the park name and
+            datetime searched for.
+        :param budget: Number of searches to return.
+        :param today: Datetime of the crawl.
+        """
+        ranked = sorted(
+            searches,
+            key=lambda search: self.priority(search[0], search[1], today),
+            reverse=True
+        )
+        return ranked[:budget]
+
+
+def reserved_dates(cursor):
+    """
+    Return a set of park name and date that had a reserved campsite when they
+    were last scraped.
+    """
+    cursor.execute(
+        """
+        SELECT DISTINCT c.park_name, r.reserve_date
+        FROM campin.reservations r
+          INNER JOIN campin.campsites c USING (campsite_id)
+        WHERE r.reserve_date >= current_date
+        """
+    )
+    reserved = set(cursor.fetchall())
+    log.info('{} park dates have reservations.'.format(len(reserved)))
+    return reserved
+
+
+def recent_scrapes(cursor, hours):
+    """
+    Return a set of park name and date of the reservation pages saved in the
+    last hours.
+
+    A park that asks for a campground to be chosen is only included for a
+    date when the page of each of its campgrounds was saved.
+    """
+    cursor.execute(
+        """
+        SELECT s.park_name, s.reserve_date
+        FROM campin.reservation_page_scrapes s
+          LEFT JOIN (
+            SELECT park_name, count(DISTINCT campground_name) as campgrounds
+            FROM campin.campsites
+            GROUP BY park_name
+          ) c USING (park_name)
+        WHERE s.scraped_date > current_timestamp - %(hours)s * interval '1 hour'
+        GROUP BY s.park_name, s.reserve_date, c.campgrounds
+        HAVING bool_or(s.campground_name = '')
+          OR count(*) >= coalesce(c.campgrounds, 1)
+        """,
+        {'hours': hours}
+    )
+    completed = set(cursor.fetchall())
+    log.info('{} park dates were scraped in the last {} hours.'.format(
+        len(completed), hours
+    ))
+    return completed
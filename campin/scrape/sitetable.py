@@ -0,0 +1,62 @@
+"""
+Parsing of the campsite table, ``.list_new``, of the reservation site's park
+pages.
+
+Park pages of large parks list hundreds of campsites, so the table is read in
+one pass with XPath expressions that are compiled once, and rows are returned
+as plain tuples.
+"""
+from lxml import etree
+
+_status_map = {'Reserve!': 'Available'}
+
+# Strings are copied out of the document, so they don't keep it in memory.
+_tables = etree.XPath(
+    "//*[contains(concat(' ', normalize-space(@class), ' '), ' list_new ')]",
+    smart_strings=False
+)
+_rows = etree.XPath('.//tbody//tr', smart_strings=False)
+_cells = etree.XPath('./td', smart_strings=False)
+_link_texts = etree.XPath('.//a/text()', smart_strings=False)
+_texts = etree.XPath('./text()', smart_strings=False)
+_hrefs = etree.XPath('.//a/@href', smart_strings=False)
+
+
+def site_tables(root):
+    """Return the campsite tables of a page."""
+    return _tables(root)
+
+
+def reservation_rows(tables):
+    """Return a list of site number and reason for each campsite row."""
+    rows = []
+    for cells in _site_cells(tables):
+        # Status of campsite reservation for the date
+        status = _link_texts(cells[3]) or _texts(cells[3])
+        rows.append((_site_number(cells), _status_map.get(status[0], status[0])))
+    return rows
+
+
+def campsite_rows(tables):
+    """
+    Return a list of site number, site type and the links of the site number
+    cell for each campsite row.
+    """
+    return [
+        (_site_number(cells), _texts(cells[2])[0], _hrefs(cells[1]))
+        for cells in _site_cells(tables)
+    ]
+
+
+def _site_cells(tables):
+    for table in tables:
+        for row in _rows(table):
+            cells = _cells(row)
+            if not cells:
+                # header row
+                continue
+            yield cells
+
+
+def _site_number(cells):
+    return _link_texts(cells[1])[0].split()[0].strip()
@@ -0,0 +1,267 @@
+"""
+Download concurrency and delay that adapt to how fast the reservation site
+answers.
+
+Requests of the reservation site are put in a download slot for each budget,
+so searches, which post the form to ``Viewer.aspx``, and campsite details and
+pictures are throttled separately. A slot backs off as soon as too many of
+its recent requests failed. Otherwise, after each round of responses, it slows
+down when the responses were slower than the budget's target latency, and
+speeds up when they were faster.
+"""
+import logging
+
+from scrapy import signals
+from scrapy.core.downloader import Slot
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+
+log = logging.getLogger(__name__)
+
+# Budget name -> paths of its requests and the limits of its slot
+DEFAULT_BUDGETS = {
+    'search': {
+        'paths': ['/Viewer.aspx'],
+        'target_latency': 3.0,
+        'concurrency': 1,
+        'max_concurrency': 4,
+        'delay': 0.5,
+        'min_delay': 0.1,
+        'max_delay': 30.0,
+    },
+    'details': {
+        'paths': ['/Details.ashx', '/Pictures.aspx'],
+        'target_latency': 1.5,
+        'concurrency': 2,
+        'max_concurrency': 8,
+        'delay': 0.2,
+        'min_delay': 0.0,
+        'max_delay': 10.0,
+    },
+}
+
+# Responses that mean the site is overloaded
+_error_statuses = frozenset([408, 429, 500, 502, 503, 504])
+
+
+class AdaptiveThrottle(object):
+    """
+    Downloader middleware that adapts the concurrency and delay of the
+    budgets' download slots.
+
+    Enabled by the ``ADAPTIVE_THROTTLE_ENABLED`` setting. Budgets of
+    ``ADAPTIVE_THROTTLE_BUDGETS`` replace the budgets of the same name in
+    :data:`DEFAULT_BUDGETS`. Other requests, such as the start pages and
+    images, use the crawl's download settings, like ``DOWNLOAD_DELAY``.
+    """
+
+    def __init__(self, crawler, budgets):
+        """
+        :param budgets: Dictionary of budget name to its paths and the keyword
+            arguments of its :class:`Budget`.
+        """
+        self._crawler = crawler
+        # Lower case path -> budget name
+        self._paths = {}
+        self._config = {}
+        for name, config in budgets.items():
+            config = dict(config)
+            for path in config.pop('paths'):
+                self._paths[path.lower()] = name
+            self._config[name] = config
+        # Slot key -> Budget
+        self._budgets = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('ADAPTIVE_THROTTLE_ENABLED'):
+            raise NotConfigured
+        budgets = dict(DEFAULT_BUDGETS)
+        budgets.update(crawler.settings.getdict('ADAPTIVE_THROTTLE_BUDGETS'))
+        throttle = cls(crawler, budgets)
+        crawler.signals.connect(throttle.spider_closed, signals.spider_closed)
+        return throttle
+
+    def process_request(self, request, spider):
+        url = urlparse_cached(request)
+        name = self._paths.get(url.path.lower())
+        if name is None:
+            return None
+
+        key = '{} {}'.format(url.hostname, name)
+        if key not in self._budgets:
+            self._budgets[key] = Budget(name, **self._config[name])
+        request.meta['download_slot'] = key
+        # The downloader removes idle slots, and would create them again with
+        # the crawl's download settings, so a missing slot is created here
+        # with the budget before the request reaches it.
+        slots = self._crawler.engine.downloader.slots
+        if key not in slots:
+            slots[key] = Slot(
+                self._budgets[key].concurrency, self._budgets[key].delay,
+                self._crawler.settings.getbool('RANDOMIZE_DOWNLOAD_DELAY')
+            )
+        self._apply(key)
+        return None
+
+    def process_response(self, request, response, spider):
+        key = request.meta.get('download_slot')
+        # Responses from the HTTP cache have no latency
+        if key in self._budgets and 'download_latency' in request.meta:
+            if response.status in _error_statuses:
+                self._budgets[key].error()
+            else:
+                self._budgets[key].response(request.meta['download_latency'])
+            self._apply(key)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        key = request.meta.get('download_slot')
+        if key in self._budgets and not isinstance(exception, IgnoreRequest):
+            self._budgets[key].error()
+            self._apply(key)
+        return None
+
+    def spider_closed(self, spider):
+        stats = self._crawler.stats
+        for budget in self._budgets.values():
+            prefix = 'throttle/{}/'.format(budget.name)
+            stats.set_value(prefix + 'concurrency', budget.concurrency)
+            stats.set_value(prefix + 'delay', budget.delay)
+            stats.set_value(prefix + 'latency', budget.latency)
+            stats.set_value(prefix + 'back_offs', budget.back_offs)
+
+    def _apply(self, key):
+        slot = self._crawler.engine.downloader.slots.get(key)
+        if slot is not None:
+            self._budgets[key].apply(slot)
+
+
+class Budget(object):
+    """Concurrency and delay of a download slot, adapted to its responses."""
+
+    def __init__(self, name, target_latency, max_concurrency, concurrency=1,
+                 delay=0.5, min_delay=0.0, max_delay=30.0,
+                 max_error_rate=0.05, min_window=20, smoothing=0.3):
+        """
+        :param target_latency: Seconds to answer a request above which the
+            site is considered slowed down.
+        :param concurrency: Requests downloaded at once when the crawl starts.
+        :param delay: Seconds between requests when the crawl starts.
+        :param max_error_rate: Part of a window's requests that may fail
+            before backing off.
+        :param min_window: Fewest responses over which the errors are counted.
+        :param smoothing: Weight of a response in the average latency.
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.delay = delay
+        # Moving average of the seconds to answer a request
+        self.latency = None
+        self.back_offs = 0
+        self._target_latency = target_latency
+        self._max_concurrency = max_concurrency
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._max_error_rate = max_error_rate
+        self._min_window = min_window
+        self._smoothing = smoothing
+        # Responses and errors of the current error window
+        self._responses = 0
+        self._errors = 0
+        # Responses since the last latency adjustment
+        self._round = 0
+
+    def apply(self, slot):
+        """Set the concurrency and delay of a downloader slot."""
+        slot.concurrency = self.concurrency
+        slot.delay = self.delay
+
+    def response(self, latency):
+        """Add a response that took latency seconds."""
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self._smoothing * (latency - self.latency)
+        self._responses += 1
+        self._round += 1
+        self._adjust()
+
+    def error(self):
+        """Add a request that failed."""
+        self._responses += 1
+        self._errors += 1
+        self._round += 1
+        self._adjust()
+
+    def _adjust(self):
+        # A window of a few responses would back off on any error, so errors
+        # are counted over at least min_window responses. The window fails as
+        # soon as it has more errors than it allows.
+        window = max(self._min_window, self.concurrency)
+        if self._errors > self._max_error_rate * window:
+            self._back_off(self._errors, self._responses)
+            self._responses = self._errors = self._round = 0
+            return
+        if self._responses >= window:
+            self._responses = self._errors = 0
+
+        # Latency is adjusted after about one round of requests at the current
+        # concurrency
+        if self._round < self.concurrency:
+            return
+        self._round = 0
+        if self.latency is None:
+            return
+        elif self.latency > self._target_latency:
+            self._slow_down()
+        else:
+            self._speed_up()
+
+    def _back_off(self, errors, responses):
+        self.back_offs += 1
+        self.concurrency = max(1, self.concurrency // 2)
+        self.delay = min(self._max_delay, max(self.delay * 2, 0.25))
+        log.info(
+            '{}: {} of the last {} requests failed. Backing off to {} '
+            'requests every {:.2f} seconds.'.format(
+                self.name, errors, responses, self.concurrency, self.delay
+            )
+        )
+
+    def _slow_down(self):
+        if self.concurrency > 1 and not self._delay_limited():
+            self.concurrency -= 1
+        elif self.delay < self.latency:
+            self.delay = min(self._max_delay, max(self.delay * 1.5, 0.1))
+        else:
+            # Requests are already further apart than they take to answer
+            return
+        log.debug(
+            '{}: latency {:.2f} seconds. Slowing down to {} requests every '
+            '{:.2f} seconds.'.format(
+                self.name, self.latency, self.concurrency, self.delay
+            )
+        )
+
+    def _speed_up(self):
+        if self._delay_limited() and self.delay > self._min_delay:
+            delay = self.delay * 0.75
+            if delay - self._min_delay < 0.01:
+                delay = self._min_delay
+            self.delay = delay
+        elif self.concurrency < self._max_concurrency:
+            self.concurrency += 1
+        else:
+            return
+        log.debug(
+            '{}: latency {:.2f} seconds. Speeding up to {} requests every '
+            '{:.2f} seconds.'.format(
+                self.name, self.latency, self.concurrency, self.delay
+            )
+        )
+
+    def _delay_limited(self):
+        # A slot downloads about concurrency / latency requests per second,
+        # unless the delay between requests allows fewer.
+        return self.delay * self.concurrency > self.latency
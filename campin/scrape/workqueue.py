@@ -0,0 +1,211 @@
+"""Queue of reservation searches shared by crawler processes."""
+import logging
+from datetime import datetime, time, timedelta
+
+from twisted.internet import defer
+from txpostgres import txpostgres
+
+log = logging.getLogger(__name__)
+
+# Every worker fills the queue with the same searches when it starts, so the
+# searches that already exist are skipped.
+_fill_query = """
+    INSERT INTO campin.reservation_work(
+      sweep_id,
+      park_id,
+      park_name,
+      reserve_date,
+      nights,
+      priority
+    )
+    SELECT %(sweep_id)s, park_id, park_name, reserve_date, nights, priority
+    FROM unnest(
+      %(park_ids)s::varchar[],
+      %(park_names)s::varchar[],
+      %(reserve_dates)s::date[],
+      %(nights)s::integer[],
+      %(priorities)s::integer[]
+    ) as w(park_id, park_name, reserve_date, nights, priority)
+    ON CONFLICT (sweep_id, park_id, reserve_date) DO NOTHING
+"""
+
+# Searches claimed by another worker's open transaction are skipped instead of
+# waited on.
+_claim_query = """
+    UPDATE campin.reservation_work w
+    SET claimed_date = current_timestamp
+    FROM (
+      SELECT park_id, reserve_date
+      FROM campin.reservation_work
+      WHERE sweep_id = %(sweep_id)s
+      AND (
+        claimed_date IS NULL
+        OR claimed_date < current_timestamp - %(claim_timeout)s
+      )
+      ORDER BY priority DESC
+      LIMIT %(limit)s
+      FOR UPDATE SKIP LOCKED
+    ) as c
+    WHERE w.sweep_id = %(sweep_id)s
+    AND w.park_id = c.park_id
+    AND w.reserve_date = c.reserve_date
+    RETURNING w.park_id, w.reserve_date, w.nights, w.priority
+"""
+
+# Searches are deleted when the worker that made them claims more.
+_done_query = """
+    DELETE FROM campin.reservation_work w
+    USING unnest(
+      %(park_ids)s::varchar[],
+      %(reserve_dates)s::date[]
+    ) as d(park_id, reserve_date)
+    WHERE w.sweep_id = %(sweep_id)s
+    AND w.park_id = d.park_id
+    AND w.reserve_date = d.reserve_date
+"""
+
+_finish_query = """
+    DELETE FROM campin.reservation_sweeps s
+    WHERE s.sweep_id = %(sweep_id)s
+    AND NOT EXISTS (
+      SELECT 1 FROM campin.reservation_work w WHERE w.sweep_id = s.sweep_id
+    )
+"""
+
+# Sweeps whose workers all stopped before finishing. A new sweep adds every
+# search again.
+_abandoned_query = """
+    DELETE FROM campin.reservation_sweeps s
+    WHERE s.created_date < current_timestamp - %(claim_timeout)s
+    AND NOT EXISTS (
+      SELECT 1 FROM campin.reservation_work w
+      WHERE w.sweep_id = s.sweep_id
+      AND w.claimed_date > current_timestamp - %(claim_timeout)s
+    )
+"""
+
+# Claimed searches that weren't made in this long are claimed again
+_claim_timeout = timedelta(hours=1)
+
+
+def create_sweep(cursor):
+    """
+    Return the id of a new sweep for workers to share, deleting sweeps that
+    were abandoned.
+    """
+    cursor.execute(_abandoned_query, {'claim_timeout': _claim_timeout})
+    cursor.execute(
+        'INSERT INTO campin.reservation_sweeps DEFAULT VALUES RETURNING sweep_id'
+    )
+    return cursor.fetchone()[0]
+
+
+class WorkQueue(object):
+    """
+    Searches of a sweep that are claimed in batches by the workers crawling
+    it.
+
+    A worker's searches are deleted when it claims the next batch, and the
+    sweep is deleted once every search was made. A claimed search isn't given
+    to another worker until claim_timeout passes, so the searches of a worker
+    that stops are claimed again by the other workers.
+    """
+
+    def __init__(self, db_settings, sweep_id, claim_size=200,
+                 claim_timeout=_claim_timeout):
+        """
+        :param db_settings: Connection arguments from the ``db.*`` settings.
+        :param sweep_id: Id of the sweep from :func:`create_sweep`.
+        :param claim_size: Number of searches claimed at a time.
+        :param claim_timeout: Timedelta after which a claimed search is
+            claimed again.
+        """
+        self._db_settings = db_settings
+        self.sweep_id = sweep_id
+        self._claim_size = claim_size
+        self._claim_timeout = claim_timeout
+        # Park id and date of the searches claimed last
+        self._claimed = []
+        self._conn = txpostgres.Connection()
+
+    def open(self):
+        return self._conn.connect(**self._db_settings)
+
+    def close(self):
+        return self._conn.close()
+
+    def fill(self, searches):
+        """
+        Add searches to the sweep.
+
+        :param searches: Iterable of park id, park name, datetime of the first
+            night, number of nights and priority.
+        :return: Deferred that fires when the searches are added.
+        """
+        searches = list(searches)
+        log.info('Sweep {}. Adding {} searches.'.format(
+            self.sweep_id, len(searches)
+        ))
+        if not searches:
+            return defer.succeed(None)
+
+        park_ids, park_names, reserve_dates, nights, priorities = zip(*searches)
+        return self._conn.runOperation(_fill_query, {
+            'sweep_id': self.sweep_id,
+            'park_ids': list(park_ids),
+            'park_names': list(park_names),
+            'reserve_dates': [d.date() for d in reserve_dates],
+            'nights': list(nights),
+            'priorities': list(priorities),
+        })
+
+    def claim(self):
+        """
+        Delete the searches claimed last, which were made, and claim the next
+        searches.
+
+        :return: Deferred that fires with a list of park id, datetime of the
+            first night, number of nights and priority. The list is empty when
+            every search of the sweep was claimed.
+        """
+        d = self._conn.runInteraction(self._claim)
+
+        def claimed(results):
+            self._claimed = [
+                (park_id, reserve_date)
+                for park_id, reserve_date, _, _ in results
+            ]
+            return [
+                (park_id, datetime.combine(reserve_date, time()), nights,
+                 priority)
+                for park_id, reserve_date, nights, priority in results
+            ]
+
+        d.addCallback(claimed)
+        return d
+
+    def _claim(self, cursor):
+        d = defer.succeed(cursor)
+        if self._claimed:
+            park_ids, reserve_dates = zip(*self._claimed)
+            d = cursor.execute(_done_query, {
+                'sweep_id': self.sweep_id,
+                'park_ids': list(park_ids),
+                'reserve_dates': list(reserve_dates),
+            })
+        d.addCallback(lambda cursor: cursor.execute(_claim_query, {
+            'sweep_id': self.sweep_id,
+            'limit': self._claim_size,
+            'claim_timeout': self._claim_timeout,
+        }))
+        d.addCallback(lambda cursor: cursor.fetchall())
+
+        def finish(results):
+            if results:
+                return results
+            d = cursor.execute(_finish_query, {'sweep_id': self.sweep_id})
+            d.addCallback(lambda _: results)
+            return d
+
+        d.addCallback(finish)
+        return d
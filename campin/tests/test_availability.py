@@ -0,0 +1,108 @@
+"""Tests of the availability index without a database."""
+import unittest
+from datetime import date, datetime
+
+from campin.api.availability import AvailabilityIndex
+
+
+def _bits(*days):
+    """Return a bitset with the bit of each of days set."""
+    bits = 0
+    for day in days:
+        bits |= 1 << day
+    return bits
+
+
+class FreeStaysTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = AvailabilityIndex()
+        self.index._add_campsite(1, 10, None, 'Algonquin')
+        self.index._add_campsite(2, 10, None, 'Algonquin')
+        self.index.reserve(1, [date(2017, 7, 3)])
+
+    def test_stays_around_reserved_night(self):
+        stays = self.index.free_stays(date(2017, 7, 1), date(2017, 7, 6), 2)
+
+        # Stays can't start the night before or the night of the reservation,
+        # or on the last night of the window.
+        self.assertEqual(stays[1], _bits(0, 3, 4))
+        self.assertEqual(stays[2], _bits(0, 1, 2, 3, 4))
+
+    def test_one_night_stays(self):
+        stays = self.index.free_stays(date(2017, 7, 1), date(2017, 7, 4), 1)
+
+        self.assertEqual(stays[1], _bits(0, 1, 3))
+
+    def test_window_before_origin(self):
+        stays = self.index.free_stays(date(2017, 6, 29), date(2017, 7, 3), 3)
+
+        self.assertEqual(stays[1], _bits(0, 1))
+        self.assertEqual(stays[2], _bits(0, 1, 2))
+
+    def test_window_after_reservations(self):
+        stays = self.index.free_stays(date(2017, 8, 1), date(2017, 8, 2), 2)
+
+        self.assertEqual(stays, {1: 1, 2: 1})
+
+    def test_sites_without_free_stays_are_left_out(self):
+        self.index.reserve(1, [date(2017, 7, 2), date(2017, 7, 4)])
+        stays = self.index.free_stays(date(2017, 7, 2), date(2017, 7, 4), 1)
+
+        self.assertNotIn(1, stays)
+        self.assertEqual(stays[2], _bits(0, 1, 2))
+
+    def test_stay_longer_than_window(self):
+        stays = self.index.free_stays(date(2017, 7, 1), date(2017, 7, 2), 3)
+
+        self.assertEqual(stays, {})
+
+    def test_reserve_before_origin(self):
+        self.index.reserve(2, [datetime(2017, 6, 30)])
+        stays = self.index.free_stays(date(2017, 6, 30), date(2017, 7, 3), 1)
+
+        self.assertEqual(stays[1], _bits(0, 1, 2))
+        self.assertEqual(stays[2], _bits(1, 2, 3))
+
+    def test_cleared_night(self):
+        self.index.clear(1, [date(2017, 7, 3)])
+        stays = self.index.free_stays(date(2017, 7, 1), date(2017, 7, 4), 4)
+
+        self.assertEqual(stays[1], 1)
+
+
+class CampsitesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = AvailabilityIndex()
+        self.index._add_campsite(1, 10, None, 'Algonquin')
+        self.index._add_campsite(2, 10, None, 'Algonquin')
+        self.index._add_campsite(3, 20, None, 'Bon Echo')
+
+    def test_moved_campsite(self):
+        self.index._add_campsite(1, 20, None, 'Bon Echo')
+
+        self.assertEqual(self.index.site_parks[1], 20)
+        self.assertEqual(
+            self.index.free_sites(date(2017, 7, 1), date(2017, 7, 1),
+                                  'Algonquin'),
+            [2]
+        )
+        self.assertEqual(
+            self.index.free_counts(date(2017, 7, 1), date(2017, 7, 1)),
+            {10: 1, 20: 2}
+        )
+
+    def test_deleted_campsite(self):
+        self.index.reserve(2, [date(2017, 7, 1)])
+        self.index._remove_campsite(2)
+
+        self.assertNotIn(2, self.index.site_parks)
+        self.assertEqual(
+            self.index.free_stays(date(2017, 7, 1), date(2017, 7, 1), 1),
+            {1: 1, 3: 1}
+        )
+        self.assertEqual(
+            self.index.free_counts(date(2017, 7, 1), date(2017, 7, 1)),
+            {10: 1, 20: 1}
+        )
@@ -0,0 +1,191 @@
+"""Tests of finding drive times with a fake Google Maps client."""
+import asyncio
+import threading
+import unittest
+from datetime import timedelta
+from types import SimpleNamespace
+
+from campin.api.campsites import find_and_save
+from campin.api.drivetimes import DriveTimeWriter
+from campin.api.singleflight import SingleFlight
+
+
+class FakeGmaps(object):
+    """Distance Matrix client that answers 1 hour 30 mins for every park."""
+
+    def __init__(self, durations=None):
+        """
+        :param durations: Dictionary of destination to duration text, for
+            destinations that don't take 1 hour 30 mins.
+        """
+        self.requests = []
+        self._durations = durations or {}
+        self._lock = threading.Lock()
+
+    def distance_matrix(self, units, origins, destinations):
+        with self._lock:
+            self.requests.append(destinations)
+        elements = []
+        for destination in destinations:
+            duration = self._durations.get(destination, '1 hour 30 mins')
+            if duration is None:
+                elements.append({'status': 'NOT_FOUND'})
+            else:
+                elements.append({'duration': {'text': duration}})
+        return {'rows': [{'elements': elements}]}
+
+
+def _request(gmaps):
+    return SimpleNamespace(
+        gmaps=lambda: gmaps,
+        registry=SimpleNamespace(single_flight=SingleFlight())
+    )
+
+
+def _records(count, start=0):
+    return [
+        {'parkName': 'Park {}'.format(i)} for i in range(start, start + count)
+    ]
+
+
+class FindAndSaveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def test_batches_of_25_destinations(self):
+        gmaps = FakeGmaps()
+        records = self.loop.run_until_complete(
+            find_and_save(_request(gmaps), 'Toronto', _records(60))
+        )
+
+        self.assertEqual(
+            sorted(len(destinations) for destinations in gmaps.requests),
+            [10, 25, 25]
+        )
+        self.assertEqual({record['driveHours'] for record in records}, {1.5})
+
+    def test_unknown_drive_time(self):
+        gmaps = FakeGmaps({'Park 1 Provincial Park, Ontario, Canada': None})
+        records = self.loop.run_until_complete(
+            find_and_save(_request(gmaps), 'Toronto', _records(2))
+        )
+
+        self.assertEqual(
+            [record['driveHours'] for record in records], [1.5, None]
+        )
+
+    def test_concurrent_requests_share_lookups(self):
+        gmaps = FakeGmaps()
+        request = _request(gmaps)
+
+        first, second = self.loop.run_until_complete(asyncio.gather(
+            find_and_save(request, 'Toronto', _records(20)),
+            find_and_save(request, 'Toronto', _records(20, start=10)),
+        ))
+
+        # Parks 10 to 19 are only looked up by the first request
+        destinations = [d for request in gmaps.requests for d in request]
+        self.assertEqual(len(destinations), 30)
+        self.assertEqual(len(set(destinations)), 30)
+        self.assertEqual(len(first), 20)
+        self.assertEqual({record['driveHours'] for record in second}, {1.5})
+
+    def test_other_origins_are_looked_up(self):
+        gmaps = FakeGmaps()
+        request = _request(gmaps)
+
+        self.loop.run_until_complete(asyncio.gather(
+            find_and_save(request, 'Toronto', _records(5)),
+            find_and_save(request, 'Ottawa', _records(5)),
+        ))
+
+        self.assertEqual(len(gmaps.requests), 2)
+
+
+class FakePool(object):
+    """asyncpg pool whose connections record the statements executed."""
+
+    def __init__(self):
+        self.executed = []
+
+    async def acquire(self):
+        return self
+
+    async def release(self, db):
+        pass
+
+    async def execute(self, query, *args):
+        self.executed.append(args)
+
+
+class DriveTimeWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.writer = None
+
+    def tearDown(self):
+        self.writer._task.cancel()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def _start(self, pool, **kwargs):
+        self.writer = DriveTimeWriter(**kwargs)
+        self.writer.start(pool)
+        return self.writer
+
+    def _run(self):
+        """Run the loop until the writer saved the queued drive times."""
+        async def save():
+            # The fake pool never waits, so a few turns of the loop save
+            # every batch.
+            for _ in range(10):
+                await asyncio.sleep(0)
+
+        self.loop.run_until_complete(save())
+
+    def test_saves_queued_drive_times_in_batches(self):
+        pool = FakePool()
+        writer = self._start(pool, max_batch_size=2)
+
+        writer.put('Toronto', [
+            (1, timedelta(hours=1)),
+            (2, timedelta(hours=2)),
+            (3, timedelta(hours=3)),
+        ])
+        self._run()
+
+        self.assertEqual(pool.executed, [
+            ([1, 2], ['Toronto', 'Toronto'],
+             [timedelta(hours=1), timedelta(hours=2)]),
+            ([3], ['Toronto'], [timedelta(hours=3)]),
+        ])
+
+    def test_keeps_saving_after_an_error(self):
+        pool = FakePool()
+        failures = [RuntimeError('connection lost')]
+
+        async def execute(query, *args):
+            if failures:
+                raise failures.pop()
+            pool.executed.append(args)
+
+        pool.execute = execute
+        writer = self._start(pool)
+
+        writer.put('Toronto', [(1, timedelta(hours=1))])
+        self._run()
+        writer.put('Ottawa', [(2, timedelta(hours=2))])
+        self._run()
+
+        self.assertEqual(
+            pool.executed, [([2], ['Ottawa'], [timedelta(hours=2)])]
+        )
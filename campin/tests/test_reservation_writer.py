@@ -0,0 +1,163 @@
+"""Tests of comparing reservation pages to the database with a fake cursor."""
+import unittest
+from datetime import date
+
+from twisted.internet import defer
+
+from campin.scrape.pipeline.persistence import reservation
+from campin.scrape.pipeline.persistence.reservation import _PageDiff
+
+DAY = date(2017, 7, 1)
+
+
+class FakeCursor(object):
+    """txpostgres cursor that answers queries with fixed rows."""
+
+    def __init__(self, results):
+        """
+        :param results: Dictionary of query to the rows it returns.
+        """
+        self.executed = []
+        self._results = results
+        self._rows = []
+
+    def execute(self, query, params):
+        self.executed.append((query, params))
+        self._rows = self._results.get(query, [])
+        return defer.succeed(self)
+
+    def fetchall(self):
+        return self._rows
+
+    def params(self, query):
+        """Return the parameters query was executed with, or None."""
+        for executed, params in self.executed:
+            if executed == query:
+                return params
+        return None
+
+
+class FakeIds(object):
+    """IdCache with a fixed set of campsite ids."""
+
+    def __init__(self, ids):
+        self._ids = dict(ids)
+
+    def cached_campsite_id(self, park_name, site_number):
+        return self._ids.get((park_name, site_number))
+
+    def set_campsite_id(self, park_name, site_number, campsite_id):
+        self._ids[(park_name, site_number)] = campsite_id
+
+
+class PageDiffTest(unittest.TestCase):
+
+    def _apply(self, pages, current=(), ids=(), found=()):
+        """
+        Apply pages with a fake cursor and return the cursor and the number of
+        reservations changed.
+
+        :param current: Rows of park name, site number, date, campsite id and
+            reason in the database.
+        :param ids: Campsite ids in the id cache.
+        :param found: Rows of park name, site number and campsite id of the
+            campsites that aren't cached.
+        """
+        cursor = FakeCursor({
+            reservation._current_query: list(current),
+            reservation._campsite_ids_query: list(found),
+        })
+        changed = []
+        d = _PageDiff(FakeIds(ids), pages).apply(cursor)
+        d.addCallback(changed.append)
+        self.assertEqual(len(changed), 1)
+        return cursor, changed[0]
+
+    def test_changes(self):
+        pages = {('Algonquin', None, DAY): {
+            '1': 'Available',
+            '2': 'Reserved',
+            '3': 'Closed',
+        }}
+        current = [
+            ('Algonquin', '1', DAY, 11, 'Reserved'),
+            ('Algonquin', '3', DAY, 13, 'Reserved'),
+            # No longer listed on the page
+            ('Algonquin', '4', DAY, 14, 'Reserved'),
+        ]
+        cursor, changed = self._apply(
+            pages, current, ids={('Algonquin', '2'): 12}
+        )
+
+        self.assertEqual(changed, 4)
+        deletes = cursor.params(reservation._delete_query)
+        self.assertEqual(sorted(deletes['campsite_ids']), [11, 14])
+        self.assertEqual(cursor.params(reservation._update_query), {
+            'campsite_ids': [13],
+            'reserve_dates': [DAY],
+            'reasons': ['Closed'],
+        })
+        self.assertEqual(cursor.params(reservation._insert_query), {
+            'campsite_ids': [12],
+            'reserve_dates': [DAY],
+            'reasons': ['Reserved'],
+        })
+        self.assertEqual(cursor.params(reservation._scrapes_query), {
+            'park_names': ['Algonquin'],
+            'reserve_dates': [DAY],
+            'changed': [True],
+        })
+        self.assertIsNone(cursor.params(reservation._campsite_ids_query))
+
+    def test_unchanged_page(self):
+        pages = {('Algonquin', None, DAY): {'1': 'Reserved', '2': 'Available'}}
+        cursor, changed = self._apply(
+            pages, [('Algonquin', '1', DAY, 11, 'Reserved')]
+        )
+
+        self.assertEqual(changed, 0)
+        for query in (reservation._delete_query, reservation._update_query,
+                      reservation._insert_query):
+            self.assertIsNone(cursor.params(query))
+        self.assertEqual(
+            cursor.params(reservation._scrapes_query)['changed'], [False]
+        )
+
+    def test_campsite_ids_that_are_not_cached(self):
+        pages = {('Algonquin', 'Achray', DAY): {'5': 'Reserved', '6': 'Closed'}}
+        cursor, changed = self._apply(
+            pages, found=[('Algonquin', '5', 15)]
+        )
+
+        # Site 6 isn't in the database, so it is skipped
+        self.assertEqual(changed, 1)
+        lookup = cursor.params(reservation._campsite_ids_query)
+        self.assertEqual(sorted(lookup['site_numbers']), ['5', '6'])
+        self.assertEqual(
+            cursor.params(reservation._insert_query)['campsite_ids'], [15]
+        )
+        self.assertEqual(cursor.params(reservation._page_scrapes_query), {
+            'park_names': ['Algonquin'],
+            'campground_names': ['Achray'],
+            'reserve_dates': [DAY],
+        })
+
+    def test_pages_of_several_campgrounds(self):
+        pages = {
+            ('Algonquin', 'Achray', DAY): {'1': 'Available'},
+            ('Algonquin', 'Kiosk', DAY): {'2': 'Available'},
+        }
+        cursor, changed = self._apply(pages)
+
+        # Counted as one scrape of the park
+        self.assertEqual(cursor.params(reservation._scrapes_query), {
+            'park_names': ['Algonquin'],
+            'reserve_dates': [DAY],
+            'changed': [False],
+        })
+        self.assertEqual(
+            sorted(cursor.params(
+                reservation._page_scrapes_query
+            )['campground_names']),
+            ['Achray', 'Kiosk']
+        )
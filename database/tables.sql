@@ -88,6 +88,94 @@ create table campin.reservations(
 
 create index reservations_date_idx on campin.reservations(reserve_date);
 
+
+-- Deleted reservations, used to incrementally refresh the API's availability
+-- index. Rows older than a day are purged when the index is refreshed.
+create table campin.reservation_deletes(
+  campsite_id integer not null,
+  reserve_date date not null,
+  deleted_date timestamp with time zone not null default current_timestamp
+);
+
+create index reservation_deletes_date_idx on campin.reservation_deletes(deleted_date);
+
+-- Deleted campsites, used and purged like campin.reservation_deletes.
+create table campin.campsite_deletes(
+  campsite_id integer not null,
+  deleted_date timestamp with time zone not null default current_timestamp
+);
+
+create index campsite_deletes_date_idx on campin.campsite_deletes(deleted_date);
+
+-- Number of free campsites per park, campground and date. Kept up to date by
+-- triggers on campin.reservations and campin.campsites, and rebuilt from
+-- scratch with rebuild_park_date_availability(). Dates without a row have no
+-- reservations, so every campsite in the campground is free.
+create table campin.park_date_availability(
+  park_id integer not null references campin.parks(park_id),
+  campground_name varchar not null default '',
+  reserve_date date not null,
+  free_count integer not null,
+  total_count integer not null,
+  primary key (park_id, campground_name, reserve_date)
+);
+
+create index park_date_availability_date_idx on campin.park_date_availability(reserve_date);
+
+
+-- Incremented by the reservation pipeline after saving reservations. The API
+-- caches search responses against this counter.
+create table campin.data_generation(
+  generation bigint not null
+);
+
+insert into campin.data_generation(generation) values(0);
+
+-- When each park and date was last scraped, and how many of its scrapes
+-- changed reservations. Used to decide which reservation pages to scrape
+-- first.
+create table campin.reservation_scrapes(
+  park_name varchar not null,
+  reserve_date date not null,
+  scraped_date timestamp with time zone not null default current_timestamp,
+  scrape_count integer not null default 0,
+  change_count integer not null default 0,
+  primary key (park_name, reserve_date)
+);
+
+-- When each reservation page was last saved. Parks that ask for a campground
+-- to be chosen have a page for each campground, others have one page with an
+-- empty campground name. Used to resume a crawl from the pages it saved.
+create table campin.reservation_page_scrapes(
+  park_name varchar not null,
+  campground_name varchar not null default '',
+  reserve_date date not null,
+  scraped_date timestamp with time zone not null default current_timestamp,
+  primary key (park_name, campground_name, reserve_date)
+);
+
+-- Reservation searches shared by the crawler processes of a sweep. Workers
+-- claim unclaimed searches with SKIP LOCKED so each search is made once, and
+-- delete them once they are made. Searches claimed too long ago, by a worker
+-- that stopped, are claimed again.
+create table campin.reservation_sweeps(
+  sweep_id serial primary key,
+  created_date timestamp with time zone not null default current_timestamp
+);
+
+create table campin.reservation_work(
+  sweep_id integer not null references campin.reservation_sweeps(sweep_id) on delete cascade,
+  park_id varchar not null,
+  park_name varchar not null,
+  reserve_date date not null,
+  nights integer not null,
+  priority integer not null default 0,
+  claimed_date timestamp with time zone,
+  primary key (sweep_id, park_id, reserve_date)
+);
+
+create index reservation_work_priority_idx on campin.reservation_work(sweep_id, priority);
+
 grant select,insert,update,delete on all tables in schema campin to campin;
 grant usage on all sequences in schema campin to campin;
 
@@ -116,3 +204,208 @@ create trigger reservations_last_modified
   FOR EACH ROW
   execute procedure update_last_modified();
 
+
+create or replace function log_reservation_delete() returns trigger as $$
+BEGIN
+  INSERT INTO campin.reservation_deletes(campsite_id, reserve_date)
+  VALUES(OLD.campsite_id, OLD.reserve_date);
+  RETURN OLD;
+END; $$ language plpgsql;
+
+create trigger reservations_deleted
+  AFTER DELETE
+  on campin.reservations
+  FOR EACH ROW
+  execute procedure log_reservation_delete();
+
+create or replace function log_campsite_delete() returns trigger as $$
+BEGIN
+  INSERT INTO campin.campsite_deletes(campsite_id)
+  VALUES(OLD.campsite_id);
+  RETURN OLD;
+END; $$ language plpgsql;
+
+create trigger campsites_deleted
+  AFTER DELETE
+  on campin.campsites
+  FOR EACH ROW
+  execute procedure log_campsite_delete();
+
+
+-- Change the free count for the campsite's campground on reserve_date by
+-- the negative of reserved, which is 1 for a new reservation and -1 for a
+-- removed reservation.
+create or replace function adjust_park_date_availability(
+  adjust_campsite_id integer,
+  adjust_reserve_date date,
+  reserved integer
+) returns void as $$
+DECLARE
+  site_park_id integer;
+  site_campground_name varchar;
+  site_count integer;
+BEGIN
+  SELECT park_id, coalesce(campground_name, '')
+  INTO site_park_id, site_campground_name
+  FROM campin.campsites
+  WHERE campsite_id = adjust_campsite_id;
+
+  UPDATE campin.park_date_availability
+  SET free_count = free_count - reserved
+  WHERE park_id = site_park_id
+  AND campground_name = site_campground_name
+  AND reserve_date = adjust_reserve_date;
+
+  IF NOT FOUND THEN
+    SELECT count(campsite_id)
+    INTO site_count
+    FROM campin.campsites
+    WHERE park_id = site_park_id
+    AND coalesce(campground_name, '') = site_campground_name;
+
+    INSERT INTO campin.park_date_availability(
+      park_id,
+      campground_name,
+      reserve_date,
+      free_count,
+      total_count
+    )VALUES(
+      site_park_id,
+      site_campground_name,
+      adjust_reserve_date,
+      site_count - reserved,
+      site_count
+    )
+    ON CONFLICT (park_id, campground_name, reserve_date) DO UPDATE
+    SET free_count = park_date_availability.free_count - reserved;
+  END IF;
+END; $$ language plpgsql;
+
+create or replace function reservation_park_date_availability() returns trigger as $$
+BEGIN
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM adjust_park_date_availability(NEW.campsite_id, NEW.reserve_date, 1);
+  END IF;
+  IF TG_OP IN ('DELETE', 'UPDATE') THEN
+    PERFORM adjust_park_date_availability(OLD.campsite_id, OLD.reserve_date, -1);
+  END IF;
+  RETURN NULL;
+END; $$ language plpgsql;
+
+create trigger reservations_park_date_availability
+  AFTER INSERT OR DELETE OR UPDATE OF campsite_id, reserve_date
+  on campin.reservations
+  FOR EACH ROW
+  execute procedure reservation_park_date_availability();
+
+-- Add the campsite to the free and total counts of a campground when moved
+-- is 1, or remove it when moved is -1. The free counts only change on dates
+-- that the campsite isn't reserved.
+create or replace function move_park_date_availability(
+  move_campsite_id integer,
+  move_park_id integer,
+  move_campground_name varchar,
+  moved integer
+) returns void as $$
+BEGIN
+  UPDATE campin.park_date_availability a
+  SET total_count = a.total_count + moved,
+    free_count = a.free_count + CASE
+      WHEN EXISTS(
+        SELECT 1
+        FROM campin.reservations r
+        WHERE r.campsite_id = move_campsite_id
+        AND r.reserve_date = a.reserve_date
+      ) THEN 0
+      ELSE moved
+    END
+  WHERE a.park_id = move_park_id
+  AND a.campground_name = move_campground_name;
+
+  IF moved > 0 THEN
+    -- Dates the campsite is reserved that had no reservations in the
+    -- campground, so every other campsite is free.
+    INSERT INTO campin.park_date_availability(
+      park_id,
+      campground_name,
+      reserve_date,
+      free_count,
+      total_count
+    )
+    SELECT
+      move_park_id,
+      move_campground_name,
+      r.reserve_date,
+      totals.total_count - 1,
+      totals.total_count
+    FROM campin.reservations r,
+      (
+        SELECT count(campsite_id) as total_count
+        FROM campin.campsites
+        WHERE park_id = move_park_id
+        AND coalesce(campground_name, '') = move_campground_name
+      ) as totals
+    WHERE r.campsite_id = move_campsite_id
+    ON CONFLICT (park_id, campground_name, reserve_date) DO NOTHING;
+  END IF;
+END; $$ language plpgsql;
+
+create or replace function campsite_park_date_availability() returns trigger as $$
+BEGIN
+  IF TG_OP = 'UPDATE'
+    AND OLD.park_id = NEW.park_id
+    AND coalesce(OLD.campground_name, '') = coalesce(NEW.campground_name, '')
+  THEN
+    RETURN NULL;
+  END IF;
+
+  IF TG_OP IN ('DELETE', 'UPDATE') THEN
+    PERFORM move_park_date_availability(
+      OLD.campsite_id, OLD.park_id, coalesce(OLD.campground_name, ''), -1
+    );
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM move_park_date_availability(
+      NEW.campsite_id, NEW.park_id, coalesce(NEW.campground_name, ''), 1
+    );
+  END IF;
+  RETURN NULL;
+END; $$ language plpgsql;
+
+create trigger campsites_park_date_availability
+  AFTER INSERT OR DELETE OR UPDATE OF park_id, campground_name
+  on campin.campsites
+  FOR EACH ROW
+  execute procedure campsite_park_date_availability();
+
+create or replace function rebuild_park_date_availability() returns void as $$
+BEGIN
+  DELETE FROM campin.park_date_availability;
+
+  INSERT INTO campin.park_date_availability(
+    park_id,
+    campground_name,
+    reserve_date,
+    free_count,
+    total_count
+  )
+  SELECT
+    c.park_id,
+    coalesce(c.campground_name, ''),
+    r.reserve_date,
+    totals.total_count - count(r.reservation_id),
+    totals.total_count
+  FROM campin.reservations r
+    INNER JOIN campin.campsites c USING (campsite_id)
+    INNER JOIN (
+      SELECT
+        park_id,
+        coalesce(campground_name, '') as campground_name,
+        count(campsite_id) as total_count
+      FROM campin.campsites
+      GROUP BY 1, 2
+    ) as totals
+    ON totals.park_id = c.park_id
+    AND totals.campground_name = coalesce(c.campground_name, '')
+  GROUP BY 1, 2, 3, totals.total_count;
+END; $$ language plpgsql;
@@ -5,6 +5,9 @@ entry_points = {
         'scrape_parks = campin.cli:scrape_parks',
         'scrape_reservations = campin.cli:scrape_reservations',
         'scrape_sites = campin.cli:scrape_sites',
+        'rebuild_availability = campin.cli:rebuild_availability',
+        'scrape_all = campin.cli:scrape_all',
+        'benchmark_scrape = campin.cli:benchmark_scrape',
     ],
     'paste.app_factory': [
         'main = campin.api:main',